@@ -1,24 +1,43 @@
-from fastapi import FastAPI, APIRouter, Depends, status
+from fastapi import FastAPI, APIRouter, Depends, Query, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
+from bson.errors import InvalidId
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Literal, Optional, Union
 import uuid
 from datetime import datetime, timezone, timedelta
 import smtplib
 from email.message import EmailMessage
 import jwt
 import bcrypt
+import numpy as np
 
 from fastapi import BackgroundTasks, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 import tempfile
 import zipfile
+import time
+import json
+import asyncio
+import hashlib
+import base64
+import csv
+import io
+import hmac
+import secrets
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+from fastapi.concurrency import run_in_threadpool
 
 # Emergent LLM integration
 from emergentintegrations.llm.chat import LlmChat, UserMessage
@@ -51,6 +70,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Create a router with the /api prefix
@@ -84,6 +104,7 @@ class ValueNumberResult(BaseModel):
     recommendation: str
     explanation: str
     timestamp: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    insight_job_id: Optional[str] = None
 
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -100,46 +121,519 @@ class UserLogin(BaseModel):
     email: EmailStr
     password: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 class UserResponse(BaseModel):
     id: str
     email: EmailStr
     created_at: str
     is_active: bool
 
+class AuthPrincipal(BaseModel):
+    """The authenticated caller on non-login paths: no password hash, and email is not re-validated."""
+    id: str
+    email: str
+    created_at: str
+    is_active: bool = True
+
+# Fields read from the users collection to build an AuthPrincipal
+AUTH_PRINCIPAL_PROJECTION = {"_id": 0, "id": 1, "email": 1, "created_at": 1, "is_active": 1}
+
+# Concurrency helpers
+class CapacityExceeded(Exception):
+    """Work was refused because a bounded queue is full or its wait deadline passed."""
+
+class ConcurrencyLimiter:
+    """Semaphore with a bounded wait queue and occupancy counters."""
+
+    def __init__(self, name: str, limit: int, max_queue: int, error=CapacityExceeded):
+        self.name = name
+        self.error = error
+        self.limit = limit
+        self.max_queue = max_queue
+        self.semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.queued = 0
+        self.counters = {"admitted": 0, "rejected": 0, "queue_timeouts": 0}
+
+    @asynccontextmanager
+    async def slot(self, timeout: float):
+        if self.semaphore.locked() and self.queued >= self.max_queue:
+            self.counters["rejected"] += 1
+            raise self.error(f"{self.name} queue is full")
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.counters["queue_timeouts"] += 1
+            raise self.error(f"Deadline passed while queued for {self.name}")
+        finally:
+            self.queued -= 1
+        self.active += 1
+        self.counters["admitted"] += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.semaphore.release()
+
+    def snapshot(self) -> dict:
+        return {**self.counters, "active": self.active, "queue_depth": self.queued, "limit": self.limit, "max_queue": self.max_queue}
+
 # Authentication functions
 JWT_SECRET = os.environ.get('JWT_SECRET_KEY', 'fallback-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 24
 
+# bcrypt work factor: pinned with BCRYPT_ROUNDS, otherwise calibrated at startup to BCRYPT_TARGET_MS per hash
+BCRYPT_ROUNDS = os.environ.get('BCRYPT_ROUNDS')
+BCRYPT_TARGET_MS = float(os.environ.get('BCRYPT_TARGET_MS', '250'))
+BCRYPT_MIN_ROUNDS = int(os.environ.get('BCRYPT_MIN_ROUNDS', '10'))
+BCRYPT_MAX_ROUNDS = int(os.environ.get('BCRYPT_MAX_ROUNDS', '15'))
+# Stored hashes whose estimated time stays within [low, high] × BCRYPT_TARGET_MS are left alone
+BCRYPT_REHASH_LOW = float(os.environ.get('BCRYPT_REHASH_LOW', '0.5'))
+BCRYPT_REHASH_HIGH = float(os.environ.get('BCRYPT_REHASH_HIGH', '2.0'))
+
+class PasswordCost:
+    """The bcrypt cost used for new hashes; stored hashes at another cost are rehashed on login."""
+
+    def __init__(self, rounds: int, target_ms: float, min_rounds: int, max_rounds: int):
+        self.rounds = rounds
+        self.target_ms = target_ms
+        self.min_rounds = min_rounds
+        self.max_rounds = max_rounds
+        self.calibrated = False
+        self.measured_ms: Optional[float] = None
+        self.counters = {"rehashed": 0, "rehash_failures": 0}
+
+    def calibrate(self, samples: int = 3) -> int:
+        """Time hashes at the minimum cost and extrapolate: each extra round doubles the work."""
+        salt = bcrypt.gensalt(rounds=self.min_rounds)
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            bcrypt.hashpw(b"calibration", salt)
+            timings.append(time.perf_counter() - start)
+        seconds = min(timings)
+        extra_rounds = int(np.floor(np.log2(max(self.target_ms / (seconds * 1000), 1.0))))
+        self.rounds = min(self.min_rounds + extra_rounds, self.max_rounds)
+        self.measured_ms = round(seconds * 1000 * 2 ** (self.rounds - self.min_rounds), 1)
+        self.calibrated = True
+        return self.rounds
+
+    def needs_rehash(self, hashed: str) -> bool:
+        rounds = bcrypt_rounds(hashed)
+        if rounds == self.rounds:
+            return False
+        if not self.calibrated or not self.min_rounds <= rounds <= self.max_rounds:
+            # A pinned cost, or a stored cost outside the allowed range, is applied exactly
+            return True
+        # Hysteresis: calibration noise near a cost boundary must not flip hashes back and forth,
+        # so only rehash when the stored cost is well off target on this machine
+        estimated_ms = self.measured_ms * 2 ** (rounds - self.rounds)
+        return not BCRYPT_REHASH_LOW * self.target_ms <= estimated_ms <= BCRYPT_REHASH_HIGH * self.target_ms
+
+    def snapshot(self) -> dict:
+        return {
+            **self.counters,
+            "rounds": self.rounds,
+            "calibrated": self.calibrated,
+            "target_ms": self.target_ms,
+            "estimated_ms": self.measured_ms,
+        }
+
+password_cost = PasswordCost(int(BCRYPT_ROUNDS or 12), BCRYPT_TARGET_MS, BCRYPT_MIN_ROUNDS, BCRYPT_MAX_ROUNDS)
+
+def bcrypt_rounds(hashed: str) -> int:
+    # Modular crypt format: $2b$<rounds>$<salt+hash>
+    return int(hashed.split('$')[2])
+
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=password_cost.rounds)).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
-def create_access_token(data: dict) -> str:
+# bcrypt is CPU-bound (~100-300 ms per call) and releases the GIL, so it runs on a dedicated
+# thread pool instead of blocking the event loop; the limiter bounds how many calls may queue
+BCRYPT_MAX_WORKERS = int(os.environ.get('BCRYPT_MAX_WORKERS', str(min(4, os.cpu_count() or 1))))
+BCRYPT_MAX_QUEUE = int(os.environ.get('BCRYPT_MAX_QUEUE', '64'))
+BCRYPT_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('BCRYPT_QUEUE_TIMEOUT_SECONDS', '5'))
+password_executor = ThreadPoolExecutor(max_workers=BCRYPT_MAX_WORKERS, thread_name_prefix="bcrypt")
+password_limiter = ConcurrencyLimiter("password hashing", BCRYPT_MAX_WORKERS, BCRYPT_MAX_QUEUE)
+
+async def _run_password_work(fn, *args):
+    try:
+        async with password_limiter.slot(BCRYPT_QUEUE_TIMEOUT_SECONDS):
+            return await asyncio.get_running_loop().run_in_executor(password_executor, fn, *args)
+    except CapacityExceeded:
+        raise HTTPException(status_code=503, detail="Server busy, please retry shortly", headers={"Retry-After": "1"})
+
+# Login/registration rate limits, checked before any bcrypt work is queued
+AUTH_RATE_IP_PER_MINUTE = float(os.environ.get('AUTH_RATE_IP_PER_MINUTE', '30'))
+AUTH_RATE_IP_BURST = float(os.environ.get('AUTH_RATE_IP_BURST', '20'))
+AUTH_RATE_EMAIL_PER_MINUTE = float(os.environ.get('AUTH_RATE_EMAIL_PER_MINUTE', '10'))
+AUTH_RATE_EMAIL_BURST = float(os.environ.get('AUTH_RATE_EMAIL_BURST', '5'))
+AUTH_RATE_SKETCH_WIDTH = int(os.environ.get('AUTH_RATE_SKETCH_WIDTH', '4096'))
+AUTH_RATE_SKETCH_DEPTH = int(os.environ.get('AUTH_RATE_SKETCH_DEPTH', '4'))
+# Proxies in front of the app that append to X-Forwarded-For; 0 uses the socket peer address.
+# Opt-in: without a proxy the client writes the header itself and could pick a fresh IP bucket per request
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '0'))
+
+class TokenBucketSketch:
+    """Token buckets for unbounded key sets in fixed memory, laid out like a count-min sketch.
+
+    Each key maps to one bucket per row and may spend a token only if all of them have one, so hash
+    collisions can make a key's limit stricter but never looser.
+    """
+
+    def __init__(self, name: str, per_minute: float, burst: float, width: int, depth: int):
+        self.name = name
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.width = width
+        self.depth = depth
+        self.tokens = np.full((depth, width), burst, dtype=np.float64)
+        self.updated = np.zeros((depth, width), dtype=np.float64)
+        self.rows = np.arange(depth)
+        self.counters = {"allowed": 0, "rejected": 0}
+
+    def _columns(self, key: str) -> np.ndarray:
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.depth).digest()
+        return np.frombuffer(digest, dtype=np.uint32) % self.width
+
+    def take(self, key: str) -> float:
+        """Spend one token for key; returns 0 when allowed, otherwise the seconds until a token frees up."""
+        now = time.monotonic()
+        columns = self._columns(key)
+        cells = (self.rows, columns)
+        tokens = np.minimum(self.burst, self.tokens[cells] + (now - self.updated[cells]) * self.rate)
+        self.tokens[cells] = tokens
+        self.updated[cells] = now
+        available = tokens.min()
+        if available < 1:
+            self.counters["rejected"] += 1
+            return (1 - available) / self.rate
+        self.tokens[cells] = tokens - 1
+        self.counters["allowed"] += 1
+        return 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            **self.counters,
+            "per_minute": round(self.rate * 60, 3),
+            "burst": self.burst,
+            "sketch_bytes": int(self.tokens.nbytes + self.updated.nbytes),
+        }
+
+auth_ip_limiter = TokenBucketSketch(
+    "ip", AUTH_RATE_IP_PER_MINUTE, AUTH_RATE_IP_BURST, AUTH_RATE_SKETCH_WIDTH, AUTH_RATE_SKETCH_DEPTH
+)
+auth_email_limiter = TokenBucketSketch(
+    "email", AUTH_RATE_EMAIL_PER_MINUTE, AUTH_RATE_EMAIL_BURST, AUTH_RATE_SKETCH_WIDTH, AUTH_RATE_SKETCH_DEPTH
+)
+
+def client_ip(request: Request) -> str:
+    forwarded = [hop.strip() for hop in request.headers.get('x-forwarded-for', '').split(',') if hop.strip()]
+    if TRUSTED_PROXY_HOPS and len(forwarded) >= TRUSTED_PROXY_HOPS:
+        # Entries left of those our own proxies appended are client-controlled
+        return forwarded[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+def enforce_auth_rate_limits(request: Request, endpoint: str, email: str):
+    for limiter, key in ((auth_ip_limiter, client_ip(request)), (auth_email_limiter, email.lower())):
+        retry_after = limiter.take(f"{endpoint}:{key}")
+        if retry_after:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many attempts, please retry later",
+                headers={"Retry-After": str(int(np.ceil(retry_after)))}
+            )
+
+async def hash_password_async(password: str) -> str:
+    return await _run_password_work(hash_password, password)
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await _run_password_work(verify_password, password, hashed)
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS)
+    expire = datetime.utcnow() + (expires_delta or timedelta(hours=JWT_EXPIRATION_HOURS))
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Optional[User]:
-    if not credentials:
-        return None
-    
-    try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
+# Stateless access tokens: carry the claims get_current_user needs so most requests skip the users lookup
+JWT_STATELESS_CLAIMS = os.environ.get('JWT_STATELESS_CLAIMS', 'true').lower() == 'true'
+STATELESS_TOKEN_FORMAT = "claims-v1"
+# User fields copied into stateless tokens; changing any of them revokes the user's outstanding tokens
+STATELESS_CLAIM_FIELDS = ("email", "is_active")
+
+# Lifetime of login tokens; clients can renew them with a refresh token instead of logging in again.
+# Defaults to the old 24 hours because the frontend does not refresh yet: an expired token silently
+# turns a user anonymous on the calculate endpoints. Lower it (e.g. 15) once clients call /api/token/refresh
+ACCESS_TOKEN_EXPIRATION_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRATION_MINUTES', str(JWT_EXPIRATION_HOURS * 60)))
+# Longest an access token from either issuer can live; per-user revocations must last at least this long
+MAX_ACCESS_TOKEN_LIFETIME = max(timedelta(minutes=ACCESS_TOKEN_EXPIRATION_MINUTES), timedelta(hours=JWT_EXPIRATION_HOURS))
+
+def create_user_access_token(user: Union[User, AuthPrincipal]) -> str:
+    expires = timedelta(minutes=ACCESS_TOKEN_EXPIRATION_MINUTES)
+    if not JWT_STATELESS_CLAIMS:
+        return create_access_token(data={"sub": user.id}, expires_delta=expires)
+    return create_access_token(data={
+        "sub": user.id,
+        "fmt": STATELESS_TOKEN_FORMAT,
+        "jti": uuid.uuid4().hex,
+        "iat": int(time.time()),
+        "email": user.email,
+        "created_at": user.created_at,
+        "is_active": user.is_active,
+    }, expires_delta=expires)
+
+# Authenticated-user cache
+USER_CACHE_MAXSIZE = int(os.environ.get('USER_CACHE_MAXSIZE', '10000'))
+# Bounds how long a change made by another server process can go unseen
+USER_CACHE_TTL_SECONDS = int(os.environ.get('USER_CACHE_TTL_SECONDS', '60'))
+
+class UserCache:
+    """TTL/LRU cache of users by id, so authenticated requests skip the users lookup."""
+
+    def __init__(self, maxsize: int, ttl_seconds: int):
+        self.users = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    async def get(self, user_id: str) -> Optional[AuthPrincipal]:
+        user = self.users.get(user_id)
+        if user is not None:
+            self.counters["hits"] += 1
+            return user
+        self.counters["misses"] += 1
+        user_data = await db.users.find_one({"id": user_id}, AUTH_PRINCIPAL_PROJECTION)
+        if user_data is None:
             return None
+        user = AuthPrincipal(**user_data)
+        self.users[user_id] = user
+        return user
+
+    def invalidate(self, user_id: str):
+        if self.users.pop(user_id, None) is not None:
+            self.counters["invalidations"] += 1
+
+    def snapshot(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "size": len(self.users),
+            "hit_ratio": round(self.counters["hits"] / lookups, 4) if lookups else None,
+        }
+
+user_cache = UserCache(USER_CACHE_MAXSIZE, USER_CACHE_TTL_SECONDS)
+
+# Token revocation set
+REVOCATION_BLOOM_BITS = int(os.environ.get('REVOCATION_BLOOM_BITS', str(1 << 20)))
+REVOCATION_BLOOM_HASHES = int(os.environ.get('REVOCATION_BLOOM_HASHES', '7'))
+# Bounds how long a revocation made by another server process can go unseen
+REVOCATION_REFRESH_SECONDS = float(os.environ.get('REVOCATION_REFRESH_SECONDS', '30'))
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings: no false negatives, tunable false-positive rate."""
+
+    def __init__(self, bits: int, hashes: int):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = np.zeros((bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, item: str) -> List[int]:
+        # Double hashing from one digest: h1 + i * h2 stands in for k independent hashes
+        digest = hashlib.sha256(item.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.array[position >> 3] |= np.uint8(1 << (position & 7))
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.array[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+class TokenRevocations:
+    """In-memory Bloom filter of revoked token ids and users, backed by the revoked_tokens collection.
+
+    A Bloom miss authorizes a stateless token without I/O; a hit is confirmed against Mongo, so
+    false positives only cost a lookup. Entries expire with the tokens they revoke.
+    """
+
+    def __init__(self, bits: int, hashes: int):
+        self.bits = bits
+        self.hashes = hashes
+        self.bloom = BloomFilter(bits, hashes)
+        self.refreshed_at: Optional[float] = None
+        self.revoked_during_refresh: List[str] = []
+        self.counters = {"checks": 0, "bloom_misses": 0, "revoked": 0, "false_positives": 0, "refreshes": 0}
+
+    async def refresh(self):
+        bloom = BloomFilter(self.bits, self.hashes)
+        self.revoked_during_refresh = []
+        now = datetime.now(timezone.utc)
+        async for doc in db.revoked_tokens.find({"expires_at": {"$gt": now}}, {"_id": 0, "key": 1}):
+            bloom.add(doc["key"])
+        # Revocations made locally while the reload ran must survive the swap
+        for key in self.revoked_during_refresh:
+            bloom.add(key)
+        self.bloom = bloom
+        self.refreshed_at = time.time()
+        self.counters["refreshes"] += 1
+
+    async def _revoke(self, key: str, expires_at: datetime, fields: dict):
+        await db.revoked_tokens.update_one(
+            {"key": key}, {"$set": {"key": key, "expires_at": expires_at, **fields}}, upsert=True
+        )
+        self.bloom.add(key)
+        self.revoked_during_refresh.append(key)
+
+    async def revoke_token(self, payload: dict):
+        # The entry only has to outlive the token it revokes
+        expires_at = datetime.fromtimestamp(payload["exp"], timezone.utc)
+        await self._revoke(f"jti:{payload['jti']}", expires_at, {"user_id": payload["sub"]})
+
+    async def revoke_user(self, user_id: str):
+        """Revoke every stateless token issued to the user up to now."""
+        expires_at = datetime.now(timezone.utc) + MAX_ACCESS_TOKEN_LIFETIME
+        await self._revoke(f"user:{user_id}", expires_at, {"user_id": user_id, "revoked_before": int(time.time())})
+
+    async def is_revoked(self, payload: dict) -> bool:
+        self.counters["checks"] += 1
+        candidates = [key for key in (f"jti:{payload['jti']}", f"user:{payload['sub']}") if key in self.bloom]
+        if not candidates:
+            self.counters["bloom_misses"] += 1
+            return False
+        async for doc in db.revoked_tokens.find({"key": {"$in": candidates}}, {"_id": 0}):
+            if doc["key"].startswith("jti:") or payload["iat"] <= doc.get("revoked_before", 0):
+                self.counters["revoked"] += 1
+                return True
+        self.counters["false_positives"] += 1
+        return False
+
+    def snapshot(self) -> dict:
+        return {
+            **self.counters,
+            "entries": self.bloom.count,
+            "bloom_bytes": int(self.bloom.array.nbytes),
+            "refreshed_at": self.refreshed_at,
+        }
+
+token_revocations = TokenRevocations(REVOCATION_BLOOM_BITS, REVOCATION_BLOOM_HASHES)
+
+async def refresh_token_revocations():
+    while True:
+        try:
+            await token_revocations.refresh()
+        except Exception as e:
+            logging.warning(f"Failed to refresh token revocations: {str(e)}")
+        await asyncio.sleep(REVOCATION_REFRESH_SECONDS)
+
+async def update_user(user_id: str, changes: dict):
+    """Apply changes to a user document; every user update must go through here to keep the cache coherent."""
+    await db.users.update_one({"id": user_id}, {"$set": changes})
+    user_cache.invalidate(user_id)
+    if any(field in changes for field in STATELESS_CLAIM_FIELDS):
+        # Outstanding stateless tokens carry the old values
+        await token_revocations.revoke_user(user_id)
+
+def decode_access_token(token: str) -> Optional[dict]:
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
     except jwt.PyJWTError:
         return None
+    return payload if payload.get("sub") is not None else None
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Optional[AuthPrincipal]:
+    if not credentials:
+        return None
     
-    user_data = await db.users.find_one({"id": user_id})
-    if user_data is None:
+    payload = decode_access_token(credentials.credentials)
+    if payload is None:
         return None
     
-    return User(**user_data)
+    if payload.get("fmt") == STATELESS_TOKEN_FORMAT:
+        if await token_revocations.is_revoked(payload):
+            return None
+        # The claims are signed by us, so they are trusted as-is
+        return AuthPrincipal.model_construct(
+            id=payload["sub"],
+            email=payload["email"],
+            created_at=payload["created_at"],
+            is_active=payload["is_active"],
+        )
+    
+    return await user_cache.get(payload["sub"])
+
+# Refresh tokens: opaque, single-use and rotated on every renewal
+REFRESH_TOKEN_EXPIRATION_DAYS = int(os.environ.get('REFRESH_TOKEN_EXPIRATION_DAYS', '30'))
+
+def _refresh_token_hash(token: str) -> str:
+    # Only a keyed digest is stored, so a leaked collection cannot be replayed
+    return hmac.new(JWT_SECRET.encode(), token.encode(), hashlib.sha256).hexdigest()
+
+async def issue_refresh_token(user_id: str, family_id: Optional[str] = None) -> str:
+    token = secrets.token_urlsafe(32)
+    now = datetime.now(timezone.utc)
+    await db.refresh_tokens.insert_one({
+        "token_hash": _refresh_token_hash(token),
+        # Every rotation of one login shares a family, so reuse of a rotated token can revoke them all
+        "family_id": family_id or uuid.uuid4().hex,
+        "user_id": user_id,
+        "used": False,
+        "created_at": now,
+        "expires_at": now + timedelta(days=REFRESH_TOKEN_EXPIRATION_DAYS),
+    })
+    return token
+
+async def issue_tokens(user: Union[User, AuthPrincipal], family_id: Optional[str] = None) -> dict:
+    return {
+        "access_token": create_user_access_token(user),
+        "refresh_token": await issue_refresh_token(user.id, family_id),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRATION_MINUTES * 60,
+    }
+
+async def rotate_refresh_token(token: str) -> dict:
+    """Exchange a refresh token for new tokens: one HMAC and one indexed update, no password check."""
+    token_hash = _refresh_token_hash(token)
+    doc = await db.refresh_tokens.find_one_and_update(
+        {"token_hash": token_hash, "used": False, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+        {"$set": {"used": True}}
+    )
+    if doc is None:
+        reused = await db.refresh_tokens.find_one({"token_hash": token_hash, "used": True}, {"family_id": 1})
+        if reused is not None:
+            # A rotated token came back: assume it was stolen and end the whole login
+            await db.refresh_tokens.delete_many({"family_id": reused["family_id"]})
+            logging.warning(f"Refresh token reuse detected; revoked token family {reused['family_id']}")
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+    user = await user_cache.get(doc["user_id"])
+    if user is None or not user.is_active:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    return await issue_tokens(user, doc["family_id"])
+
+async def revoke_refresh_token(token: str):
+    doc = await db.refresh_tokens.find_one({"token_hash": _refresh_token_hash(token)}, {"family_id": 1})
+    if doc is not None:
+        await db.refresh_tokens.delete_many({"family_id": doc["family_id"]})
+
+# Comma-separated emails allowed to use the /api/admin endpoints
+ADMIN_EMAILS = {email.strip().lower() for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email.strip()}
+
+async def require_admin(current_user: Optional[AuthPrincipal] = Depends(get_current_user)) -> AuthPrincipal:
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
 
 # Value Number™ calculation functions
 def convert_time_to_minutes(time_input: TimeInput) -> float:
@@ -211,27 +705,617 @@ def calculate_w_formula(inputs: ValueNumberInputW) -> ValueNumberResult:
         explanation=explanation
     )
 
+# Value Number™ vectorized kernels
+# Lower bounds of the recommendation bands, ascending; mirrors calculate_s_formula/calculate_w_formula
+RECOMMENDATION_THRESHOLDS = np.array([0.7, 1.0, 1.5])
+RECOMMENDATION_LABELS = np.array(["no_go", "caution", "go", "strong_go"])
+MAX_TIME_MINUTES = 9999 * 60 + 59
+BATCH_MAX_ROWS = int(os.environ.get('BATCH_MAX_ROWS', '100000'))
+BATCH_MAX_INSIGHT_ROWS = int(os.environ.get('BATCH_MAX_INSIGHT_ROWS', '50'))
+
+def s_formula_kernel(Z, Y, V):
+    # S = Z / (Y + V), elementwise over NumPy arrays
+    return Z / (Y + V)
+
+def w_formula_kernel(Z, M, Y, T, V):
+    # W = (Z×M) / (Y×T + V), elementwise over NumPy arrays
+    return (Z * M) / (Y * T + V)
+
+def recommendation_band_index(values: np.ndarray) -> np.ndarray:
+    """Map value numbers to band indexes into RECOMMENDATION_LABELS (0=no_go ... 3=strong_go)."""
+    return np.searchsorted(RECOMMENDATION_THRESHOLDS, values, side="right")
+
+class BatchCalculationInput(BaseModel):
+    calculation_type: Literal["s_formula", "w_formula"]
+    old_time_minutes: List[float]
+    old_effort: List[float]
+    training_time_minutes: List[float]
+    new_effort: List[float]
+    old_cost: Optional[List[float]] = None
+    new_cost: Optional[List[float]] = None
+    include_insights: bool = False
+
+class BatchCalculationResult(BaseModel):
+    calculation_type: str
+    count: int
+    value_number: List[float]
+    recommendation: List[str]
+    band_counts: Dict[str, int]
+    insights: Optional[List[str]] = None
+    timestamp: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+
+def _batch_column(name: str, values: Optional[List[float]], low: float, high: float) -> np.ndarray:
+    if values is None:
+        raise HTTPException(status_code=400, detail=f"{name} is required for this calculation type")
+    column = np.asarray(values, dtype=np.float64)
+    invalid = ~np.isfinite(column) | (column < low) | (column > high)
+    if invalid.any():
+        rows = np.flatnonzero(invalid)[:10].tolist()
+        raise HTTPException(status_code=400, detail=f"{name} must be between {low} and {high} (rows {rows})")
+    return column
+
+def evaluate_batch(payload: BatchCalculationInput) -> np.ndarray:
+    """Validate the columnar batch and compute every value number in one vectorized pass."""
+    count = len(payload.old_time_minutes)
+    if count == 0:
+        raise HTTPException(status_code=400, detail="Batch must contain at least one row")
+    if count > BATCH_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds the maximum of {BATCH_MAX_ROWS} rows")
+
+    columns = ["old_time_minutes", "old_effort", "training_time_minutes", "new_effort"]
+    if payload.calculation_type == "w_formula":
+        columns += ["old_cost", "new_cost"]
+    for name in columns:
+        values = getattr(payload, name)
+        if values is not None and len(values) != count:
+            raise HTTPException(status_code=400, detail=f"{name} has {len(values)} rows, expected {count}")
+
+    Z = _batch_column("old_time_minutes", payload.old_time_minutes, 0, MAX_TIME_MINUTES)
+    _batch_column("old_effort", payload.old_effort, 1.0, 10.0)
+    Y = _batch_column("training_time_minutes", payload.training_time_minutes, 0, MAX_TIME_MINUTES)
+    V = _batch_column("new_effort", payload.new_effort, 1.0, 10.0)
+
+    # new_effort >= 1 keeps both denominators strictly positive
+    if payload.calculation_type == "s_formula":
+        return s_formula_kernel(Z, Y, V)
+    M = _batch_column("old_cost", payload.old_cost, 0, np.inf)
+    T = _batch_column("new_cost", payload.new_cost, 0, np.inf)
+    return w_formula_kernel(Z, M, Y, T, V)
+
+# Value Number™ parameter sweeps
+SWEEP_MAX_CELLS = int(os.environ.get('SWEEP_MAX_CELLS', '250000'))
+# Sweepable variables and their valid ranges; times are in minutes
+SWEEP_VARIABLES = {
+    "old_time": (0, MAX_TIME_MINUTES),
+    "training_time": (0, MAX_TIME_MINUTES),
+    "new_effort": (1.0, 10.0),
+    "old_cost": (0, np.inf),
+    "new_cost": (0, np.inf),
+}
+W_ONLY_VARIABLES = {"old_cost", "new_cost"}
+
+class SweepAxis(BaseModel):
+    variable: Literal["old_time", "training_time", "new_effort", "old_cost", "new_cost"]
+    start: float
+    stop: float
+    steps: int = Field(ge=2, le=2000)
+
+class SweepRequest(BaseModel):
+    calculation_type: Literal["s_formula", "w_formula"]
+    inputs: Union[ValueNumberInputW, ValueNumberInputS]
+    x: SweepAxis
+    y: Optional[SweepAxis] = None
+
+class SweepResult(BaseModel):
+    calculation_type: str
+    x_variable: str
+    x_values: List[float]
+    y_variable: Optional[str] = None
+    y_values: Optional[List[float]] = None
+    values: List[List[float]]
+    bands: List[List[int]]
+    band_labels: List[str]
+    thresholds: List[float]
+    boundaries: List[List[Optional[float]]]
+
+def _sweep_axis_values(axis: SweepAxis, calculation_type: str) -> np.ndarray:
+    if calculation_type == "s_formula" and axis.variable in W_ONLY_VARIABLES:
+        raise HTTPException(status_code=400, detail=f"{axis.variable} is not an S formula variable")
+    low, high = SWEEP_VARIABLES[axis.variable]
+    if not (low <= min(axis.start, axis.stop) and max(axis.start, axis.stop) <= high):
+        raise HTTPException(status_code=400, detail=f"{axis.variable} range must be within {low} and {high}")
+    return np.linspace(axis.start, axis.stop, axis.steps)
+
+def _exact_crossings(calculation_type: str, variable: str, grid: dict) -> np.ndarray:
+    """Solve the formula for the swept variable at each threshold, broadcast to (rows, thresholds).
+
+    Both formulas are hyperbolic in every variable, so interpolating between grid points is inexact.
+    """
+    t = RECOMMENDATION_THRESHOLDS[None, :]
+    Z, Y, V = grid["old_time"], grid["training_time"], grid["new_effort"]
+    M, T = grid["old_cost"], grid["new_cost"]
+    if calculation_type == "s_formula":
+        # S = Z / (Y + V)
+        solutions = {
+            "old_time": lambda: t * (Y + V),
+            "training_time": lambda: Z / t - V,
+            "new_effort": lambda: Z / t - Y,
+        }
+    else:
+        # W = (Z×M) / (Y×T + V)
+        solutions = {
+            "old_time": lambda: t * (Y * T + V) / M,
+            "old_cost": lambda: t * (Y * T + V) / Z,
+            "training_time": lambda: (Z * M / t - V) / T,
+            "new_cost": lambda: (Z * M / t - V) / Y,
+            "new_effort": lambda: Z * M / t - Y * T,
+        }
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.asarray(solutions[variable](), dtype=np.float64)
+
+def _threshold_crossings(values: np.ndarray, x_values: np.ndarray, exact: Optional[np.ndarray] = None) -> np.ndarray:
+    """Locate, per row, the x position where the values cross each recommendation threshold.
+
+    Both formulas are monotonic in every sweep variable, so each row crosses a threshold at most once.
+    The closed-form solution is used when it falls inside the grid interval where the band changes;
+    otherwise the crossing is interpolated linearly. Returns an array of shape (rows, thresholds)
+    with NaN where no crossing occurs.
+    """
+    diff = values[:, None, :] - RECOMMENDATION_THRESHOLDS[None, :, None]
+    below = diff < 0
+    changes = below[..., 1:] != below[..., :-1]
+    index = changes.argmax(axis=-1)
+    v0 = np.take_along_axis(values[:, None, :], index[..., None], axis=-1)[..., 0]
+    v1 = np.take_along_axis(values[:, None, :], index[..., None] + 1, axis=-1)[..., 0]
+    x0, x1 = x_values[index], x_values[index + 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing = x0 + (x1 - x0) * (RECOMMENDATION_THRESHOLDS[None, :] - v0) / (v1 - v0)
+    if exact is not None:
+        exact = np.broadcast_to(exact, crossing.shape)
+        slack = 1e-9 * np.maximum(np.abs(x0), np.abs(x1))
+        inside = np.isfinite(exact) & (exact >= np.minimum(x0, x1) - slack) & (exact <= np.maximum(x0, x1) + slack)
+        crossing = np.where(inside, exact, crossing)
+    return np.where(changes.any(axis=-1), crossing, np.nan)
+
+def evaluate_sweep(request: SweepRequest) -> SweepResult:
+    """Evaluate the formula over the requested one- or two-variable grid as one broadcast computation."""
+    if request.calculation_type == "w_formula" and not isinstance(request.inputs, ValueNumberInputW):
+        raise HTTPException(status_code=400, detail="W formula sweeps require old_cost and new_cost inputs")
+    if request.y is not None and request.y.variable == request.x.variable:
+        raise HTTPException(status_code=400, detail="x and y must sweep different variables")
+    ny = request.y.steps if request.y is not None else 1
+    if request.x.steps * ny > SWEEP_MAX_CELLS:
+        raise HTTPException(status_code=400, detail=f"Sweep grid exceeds the maximum of {SWEEP_MAX_CELLS} cells")
+
+    inputs = request.inputs
+    grid = {
+        "old_time": np.float64(convert_time_to_minutes(inputs.old_time)),
+        "training_time": np.float64(convert_time_to_minutes(inputs.training_time)),
+        "new_effort": np.float64(inputs.new_effort),
+        "old_cost": np.float64(getattr(inputs, "old_cost", 0.0)),
+        "new_cost": np.float64(getattr(inputs, "new_cost", 0.0)),
+    }
+    x_values = _sweep_axis_values(request.x, request.calculation_type)
+    grid[request.x.variable] = x_values[None, :]
+    y_values = None
+    if request.y is not None:
+        y_values = _sweep_axis_values(request.y, request.calculation_type)
+        grid[request.y.variable] = y_values[:, None]
+
+    if request.calculation_type == "s_formula":
+        values = s_formula_kernel(grid["old_time"], grid["training_time"], grid["new_effort"])
+    else:
+        values = w_formula_kernel(grid["old_time"], grid["old_cost"], grid["training_time"], grid["new_cost"], grid["new_effort"])
+    values = np.broadcast_to(values, (ny, request.x.steps))
+
+    exact = _exact_crossings(request.calculation_type, request.x.variable, grid)
+    boundaries = np.round(_threshold_crossings(values, x_values, exact), 4)
+    return SweepResult(
+        calculation_type=request.calculation_type,
+        x_variable=request.x.variable,
+        x_values=x_values.tolist(),
+        y_variable=request.y.variable if request.y is not None else None,
+        y_values=y_values.tolist() if y_values is not None else None,
+        values=np.round(values, 2).tolist(),
+        bands=recommendation_band_index(values).tolist(),
+        band_labels=RECOMMENDATION_LABELS.tolist(),
+        thresholds=RECOMMENDATION_THRESHOLDS.tolist(),
+        boundaries=[[None if np.isnan(b) else float(b) for b in row] for row in boundaries]
+    )
+
+# Value Number™ Monte Carlo uncertainty mode
+MONTE_CARLO_MAX_SAMPLES = 1_000_000
+MONTE_CARLO_CHUNK_SIZE = int(os.environ.get('MONTE_CARLO_CHUNK_SIZE', '65536'))
+MONTE_CARLO_TIME_BUDGET_MS = float(os.environ.get('MONTE_CARLO_TIME_BUDGET_MS', '250'))
+
+class Distribution(BaseModel):
+    kind: Literal["point", "uniform", "triangular", "normal"] = "point"
+    value: Optional[float] = None
+    low: Optional[float] = None
+    high: Optional[float] = None
+    mode: Optional[float] = None
+    mean: Optional[float] = None
+    std: Optional[float] = Field(default=None, ge=0)
+
+class MonteCarloRequest(BaseModel):
+    calculation_type: Literal["s_formula", "w_formula"]
+    # Times are in minutes; plain numbers are treated as point values
+    old_time: Union[float, Distribution]
+    training_time: Union[float, Distribution]
+    new_effort: Union[float, Distribution]
+    old_cost: Optional[Union[float, Distribution]] = None
+    new_cost: Optional[Union[float, Distribution]] = None
+    samples: int = Field(default=100_000, ge=1, le=MONTE_CARLO_MAX_SAMPLES)
+    percentiles: List[float] = Field(default_factory=lambda: [5.0, 25.0, 50.0, 75.0, 95.0])
+    bins: int = Field(default=40, ge=1, le=500)
+    seed: Optional[int] = None
+
+class MonteCarloResult(BaseModel):
+    calculation_type: str
+    samples_requested: int
+    samples_evaluated: int
+    truncated: bool
+    elapsed_ms: float
+    mean: float
+    std: float
+    percentiles: Dict[str, float]
+    probabilities: Dict[str, float]
+    histogram_edges: List[float]
+    histogram_counts: List[int]
+
+def _sampler(name: str, spec: Union[float, Distribution, None]):
+    """Validate a distribution up front and return a function drawing n clipped samples from it."""
+    if spec is None:
+        raise HTTPException(status_code=400, detail=f"{name} is required for this calculation type")
+    if not isinstance(spec, Distribution):
+        spec = Distribution(kind="point", value=spec)
+    # Samples are clipped to the same ranges the point-value models enforce
+    low, high = SWEEP_VARIABLES[name]
+
+    if spec.kind == "point":
+        if spec.value is None:
+            raise HTTPException(status_code=400, detail=f"{name}: point distribution requires value")
+        value = float(np.clip(spec.value, low, high))
+        return lambda rng, n: np.full(n, value)
+    if spec.kind == "uniform":
+        if spec.low is None or spec.high is None or spec.low > spec.high:
+            raise HTTPException(status_code=400, detail=f"{name}: uniform distribution requires low <= high")
+        return lambda rng, n: np.clip(rng.uniform(spec.low, spec.high, n), low, high)
+    if spec.kind == "triangular":
+        if spec.low is None or spec.high is None or spec.mode is None or not (spec.low <= spec.mode <= spec.high) or spec.low == spec.high:
+            raise HTTPException(status_code=400, detail=f"{name}: triangular distribution requires low <= mode <= high and low < high")
+        return lambda rng, n: np.clip(rng.triangular(spec.low, spec.mode, spec.high, n), low, high)
+    if spec.mean is None or spec.std is None:
+        raise HTTPException(status_code=400, detail=f"{name}: normal distribution requires mean and std")
+    return lambda rng, n: np.clip(rng.normal(spec.mean, spec.std, n), low, high)
+
+def simulate_value_number(request: MonteCarloRequest) -> MonteCarloResult:
+    """Draw samples for every uncertain input and evaluate the formula in fixed-size chunks.
+
+    Chunking bounds the memory of the intermediate input arrays; only the float32 value array is
+    kept for percentiles. Evaluation stops early once MONTE_CARLO_TIME_BUDGET_MS is spent.
+    """
+    names = ["old_time", "training_time", "new_effort"]
+    if request.calculation_type == "w_formula":
+        names += ["old_cost", "new_cost"]
+    samplers = {name: _sampler(name, getattr(request, name)) for name in names}
+    if any(not 0 <= q <= 100 for q in request.percentiles):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+
+    rng = np.random.default_rng(request.seed)
+    values = np.empty(request.samples, dtype=np.float32)
+    started = time.perf_counter()
+    deadline = started + MONTE_CARLO_TIME_BUDGET_MS / 1000
+    done = 0
+    while done < request.samples:
+        n = min(MONTE_CARLO_CHUNK_SIZE, request.samples - done)
+        draws = {name: sampler(rng, n) for name, sampler in samplers.items()}
+        if request.calculation_type == "s_formula":
+            chunk = s_formula_kernel(draws["old_time"], draws["training_time"], draws["new_effort"])
+        else:
+            chunk = w_formula_kernel(draws["old_time"], draws["old_cost"], draws["training_time"], draws["new_cost"], draws["new_effort"])
+        values[done:done + n] = chunk
+        done += n
+        if time.perf_counter() > deadline:
+            break
+    values = values[:done]
+
+    bands = np.bincount(recommendation_band_index(values), minlength=len(RECOMMENDATION_LABELS))
+    counts, edges = np.histogram(values, bins=request.bins)
+    return MonteCarloResult(
+        calculation_type=request.calculation_type,
+        samples_requested=request.samples,
+        samples_evaluated=done,
+        truncated=done < request.samples,
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 2),
+        mean=round(float(values.mean(dtype=np.float64)), 4),
+        std=round(float(values.std(dtype=np.float64)), 4),
+        percentiles={f"p{q:g}": round(float(v), 4) for q, v in zip(request.percentiles, np.percentile(values, request.percentiles))},
+        probabilities=dict(zip(RECOMMENDATION_LABELS.tolist(), np.round(bands / done, 6).tolist())),
+        histogram_edges=np.round(edges.astype(np.float64), 4).tolist(),
+        histogram_counts=counts.tolist()
+    )
+
+# AI insight cache
+INSIGHT_CACHE_MAXSIZE = int(os.environ.get('INSIGHT_CACHE_MAXSIZE', '5000'))
+INSIGHT_CACHE_TTL_SECONDS = int(os.environ.get('INSIGHT_CACHE_TTL_SECONDS', '86400'))
+INSIGHT_CACHE_MONGO_TTL_SECONDS = int(os.environ.get('INSIGHT_CACHE_MONGO_TTL_SECONDS', str(30 * 86400)))
+# Offline benchmarks can run without the Mongo tier
+INSIGHT_CACHE_PERSISTENT = os.environ.get('INSIGHT_CACHE_PERSISTENT', 'true').lower() == 'true'
+# Inputs closer than these steps share one cached insight
+INSIGHT_CACHE_TIME_QUANTUM_MINUTES = int(os.environ.get('INSIGHT_CACHE_TIME_QUANTUM_MINUTES', '5'))
+INSIGHT_CACHE_EFFORT_QUANTUM = 0.5
+
+def _quantize(value: float, step: float) -> float:
+    return round(round(float(value) / step) * step, 4)
+
+def insight_cache_key(result: ValueNumberResult, inputs: dict) -> str:
+    """Key an insight on calculation type, recommendation band and quantized inputs."""
+    normalized = {"type": result.calculation_type, "recommendation": result.recommendation}
+    for name in ("old_time", "training_time"):
+        time_input = inputs.get(name) or {}
+        minutes = time_input.get('hours', 0) * 60 + time_input.get('minutes', 0)
+        normalized[name] = _quantize(minutes, INSIGHT_CACHE_TIME_QUANTUM_MINUTES)
+    for name in ("old_effort", "new_effort"):
+        normalized[name] = _quantize(inputs.get(name, 0), INSIGHT_CACHE_EFFORT_QUANTUM)
+    if result.calculation_type == "w_formula":
+        for name in ("old_cost", "new_cost"):
+            # Costs keep three significant figures
+            normalized[name] = float(f"{float(inputs.get(name, 0)):.3g}")
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+class InsightCache:
+    """Two-tier insight cache: an in-process LRU/TTL tier in front of a Mongo tier that survives restarts."""
+
+    def __init__(self, maxsize: int, ttl_seconds: int, persistent: bool = True):
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self.persistent = persistent
+        self.counters = {"memory_hits": 0, "mongo_hits": 0, "misses": 0, "stores": 0, "errors": 0}
+
+    async def get(self, key: str) -> Optional[str]:
+        insight = self.memory.get(key)
+        if insight is not None:
+            self.counters["memory_hits"] += 1
+            return insight
+        if not self.persistent:
+            self.counters["misses"] += 1
+            return None
+        try:
+            doc = await db.insight_cache.find_one({"_id": key}, {"insight": 1})
+        except Exception as e:
+            logging.warning(f"Insight cache lookup failed: {str(e)}")
+            self.counters["errors"] += 1
+            doc = None
+        if doc:
+            self.memory[key] = doc["insight"]
+            self.counters["mongo_hits"] += 1
+            return doc["insight"]
+        self.counters["misses"] += 1
+        return None
+
+    async def set(self, key: str, insight: str):
+        self.memory[key] = insight
+        self.counters["stores"] += 1
+        if not self.persistent:
+            return
+        try:
+            await db.insight_cache.update_one(
+                {"_id": key},
+                {"$set": {"insight": insight, "created_at": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+        except Exception as e:
+            logging.warning(f"Insight cache store failed: {str(e)}")
+            self.counters["errors"] += 1
+
+    def snapshot(self) -> dict:
+        hits = self.counters["memory_hits"] + self.counters["mongo_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "memory_size": len(self.memory),
+            "memory_maxsize": int(self.memory.maxsize),
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+        }
+
+insight_cache = InsightCache(INSIGHT_CACHE_MAXSIZE, INSIGHT_CACHE_TTL_SECONDS, INSIGHT_CACHE_PERSISTENT)
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key onto one in-flight upstream call."""
+
+    def __init__(self):
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.counters = {"calls": 0, "upstream_calls": 0, "deduplicated": 0}
+
+    async def run(self, key: str, fn):
+        self.counters["calls"] += 1
+        future = self.inflight.get(key)
+        if future is None:
+            self.counters["upstream_calls"] += 1
+            future = asyncio.ensure_future(fn())
+            self.inflight[key] = future
+            future.add_done_callback(lambda f: self._settle(key, f))
+        else:
+            self.counters["deduplicated"] += 1
+        # Shield so one cancelled waiter does not cancel the call shared with the others
+        return await asyncio.shield(future)
+
+    def _settle(self, key: str, future: asyncio.Future):
+        if self.inflight.get(key) is future:
+            del self.inflight[key]
+        if not future.cancelled():
+            # Mark the exception retrieved even if every waiter went away
+            future.exception()
+
+    def snapshot(self) -> dict:
+        return {**self.counters, "in_flight": len(self.inflight)}
+
+insight_flight = SingleFlight()
+
+# Approximate (nearest-neighbour) insight cache
+INSIGHT_SEMANTIC_CAPACITY = int(os.environ.get('INSIGHT_SEMANTIC_CAPACITY', '2000'))
+INSIGHT_SEMANTIC_MIN_SIMILARITY = float(os.environ.get('INSIGHT_SEMANTIC_MIN_SIMILARITY', '0.95'))
+
+def insight_features(result: ValueNumberResult, inputs: dict) -> np.ndarray:
+    """Feature vector (Z, Y, V, M, T, value number) on log scales, so nearby scenarios sit close together."""
+    def minutes(name: str) -> float:
+        time_input = inputs.get(name) or {}
+        return time_input.get('hours', 0) * 60 + time_input.get('minutes', 0)
+
+    return np.array([
+        np.log1p(minutes('old_time')),
+        np.log1p(minutes('training_time')),
+        float(inputs.get('new_effort', 0)) / 10,
+        np.log1p(float(inputs.get('old_cost', 0))),
+        np.log1p(float(inputs.get('new_cost', 0))),
+        np.log1p(max(result.value_number, 0)),
+    ], dtype=np.float32)
+
+class SemanticInsightCache:
+    """Fixed-size matrix of scenario feature vectors; a lookup returns the insight of the nearest stored
+    scenario with the same calculation type and recommendation band, if it is similar enough."""
+
+    def __init__(self, capacity: int, min_similarity: float):
+        self.min_similarity = min_similarity
+        self.vectors = np.zeros((capacity, 6), dtype=np.float32)
+        self.groups = np.full(capacity, -1, dtype=np.int16)  # -1 marks an empty slot
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.insights: List[Optional[str]] = [None] * capacity
+        self.clock = 0
+        self.hit_similarity_sum = 0.0
+        self.hit_similarity_min: Optional[float] = None
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @staticmethod
+    def _group(result: ValueNumberResult) -> int:
+        band = int(np.flatnonzero(RECOMMENDATION_LABELS == result.recommendation)[0])
+        return (1 if result.calculation_type == "w_formula" else 0) * len(RECOMMENDATION_LABELS) + band
+
+    def get(self, result: ValueNumberResult, inputs: dict) -> Optional[str]:
+        candidates = np.flatnonzero(self.groups == self._group(result))
+        if candidates.size:
+            distances = np.linalg.norm(self.vectors[candidates] - insight_features(result, inputs), axis=1)
+            nearest = int(distances.argmin())
+            similarity = float(np.exp(-distances[nearest]))
+            if similarity >= self.min_similarity:
+                slot = int(candidates[nearest])
+                self.clock += 1
+                self.last_used[slot] = self.clock
+                self.counters["hits"] += 1
+                self.hit_similarity_sum += similarity
+                self.hit_similarity_min = similarity if self.hit_similarity_min is None else min(self.hit_similarity_min, similarity)
+                return self.insights[slot]
+        self.counters["misses"] += 1
+        return None
+
+    def set(self, result: ValueNumberResult, inputs: dict, insight: str):
+        empty = np.flatnonzero(self.groups < 0)
+        if empty.size:
+            slot = int(empty[0])
+        else:
+            # Evict the least recently used scenario
+            slot = int(self.last_used.argmin())
+            self.counters["evictions"] += 1
+        self.clock += 1
+        self.vectors[slot] = insight_features(result, inputs)
+        self.groups[slot] = self._group(result)
+        self.last_used[slot] = self.clock
+        self.insights[slot] = insight
+        self.counters["stores"] += 1
+
+    def snapshot(self) -> dict:
+        hits = self.counters["hits"]
+        return {
+            **self.counters,
+            "size": int((self.groups >= 0).sum()),
+            "capacity": len(self.insights),
+            "min_similarity": self.min_similarity,
+            "mean_hit_similarity": round(self.hit_similarity_sum / hits, 4) if hits else None,
+            "lowest_hit_similarity": round(self.hit_similarity_min, 4) if self.hit_similarity_min is not None else None,
+        }
+
+semantic_insight_cache = SemanticInsightCache(INSIGHT_SEMANTIC_CAPACITY, INSIGHT_SEMANTIC_MIN_SIMILARITY)
+
+async def _cached_insight(result: ValueNumberResult, inputs: dict, cache_key: str) -> Optional[str]:
+    # Exact key first, then the nearest similar scenario
+    cached = await insight_cache.get(cache_key)
+    if cached is None:
+        cached = semantic_insight_cache.get(result, inputs)
+    return cached
+
+async def _store_insight(result: ValueNumberResult, inputs: dict, cache_key: str, insight: str):
+    semantic_insight_cache.set(result, inputs, insight)
+    await insight_cache.set(cache_key, insight)
+
+# LLM concurrency limit, deadline and circuit breaker
+INSIGHT_MAX_CONCURRENCY = int(os.environ.get('INSIGHT_MAX_CONCURRENCY', '8'))
+INSIGHT_MAX_QUEUE = int(os.environ.get('INSIGHT_MAX_QUEUE', '64'))
+INSIGHT_DEADLINE_SECONDS = float(os.environ.get('INSIGHT_DEADLINE_SECONDS', '8'))
+INSIGHT_BREAKER_FAILURES = int(os.environ.get('INSIGHT_BREAKER_FAILURES', '5'))
+INSIGHT_BREAKER_RESET_SECONDS = float(os.environ.get('INSIGHT_BREAKER_RESET_SECONDS', '30'))
+
+class InsightUnavailable(CapacityExceeded):
+    """The LLM was not called because the queue is full, the deadline passed or the breaker is open."""
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open single trial after the reset period."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.counters = {"opened": 0, "short_circuited": 0}
+
+    def is_open(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+        return self.state == "open"
+
+    def allow(self) -> bool:
+        if not self.is_open() and (self.state == "closed" or not self.trial_in_flight):
+            self.trial_in_flight = self.state == "half_open"
+            return True
+        self.counters["short_circuited"] += 1
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.counters["opened"] += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        # A half-open trial that ended without an outcome (e.g. cancelled) frees the slot
+        self.trial_in_flight = False
+
+    def snapshot(self) -> dict:
+        self.is_open()
+        return {**self.counters, "state": self.state, "consecutive_failures": self.failures}
+
+insight_limiter = ConcurrencyLimiter("the LLM", INSIGHT_MAX_CONCURRENCY, INSIGHT_MAX_QUEUE, error=InsightUnavailable)
+
 # AI Insights function using Emergent LLM
-async def generate_ai_insights(result: ValueNumberResult, inputs: dict) -> str:
-    """Generate AI-powered insights and recommendations based on calculation results."""
-    try:
-        # Initialize LLM chat with Emergent key
-        emergent_key = os.environ.get('EMERGENT_LLM_KEY')
-        if not emergent_key:
-            return "AI insights unavailable - API key not configured."
-        
-        chat = LlmChat(
-            api_key=emergent_key,
-            session_id=f"vn-insights-{uuid.uuid4()}",
-            system_message="""You are an expert decision-making advisor for the Value Number™ system. 
+INSIGHT_SYSTEM_MESSAGE = """You are an expert decision-making advisor for the Value Number™ system. 
             Your role is to provide insightful, actionable recommendations based on calculation results.
             Keep responses concise (2-3 sentences), professional, and focused on practical next steps.
             Always maintain the SCI™ Standard of integrity and mathematical precision."""
-        ).with_model("openai", "gpt-4o-mini")
-        
-        # Create contextual prompt based on formula type
-        if result.calculation_type == "s_formula":
-            prompt = f"""Based on this S Formula calculation:
+INSIGHT_FALLBACK = "AI insights temporarily unavailable. The mathematical analysis above provides reliable guidance for your decision."
+
+def build_insight_prompt(result: ValueNumberResult, inputs: dict) -> str:
+    # Create contextual prompt based on formula type
+    if result.calculation_type == "s_formula":
+        return f"""Based on this S Formula calculation:
             - Value Number: {result.value_number}
             - Recommendation: {result.recommendation}
             - Old Time: {inputs.get('old_time', {}).get('hours', 0)}h {inputs.get('old_time', {}).get('minutes', 0)}m
@@ -240,8 +1324,7 @@ async def generate_ai_insights(result: ValueNumberResult, inputs: dict) -> str:
             - New Effort: {inputs.get('new_effort', 0)}/10
             
             Provide specific insights and next steps for this decision scenario."""
-        else:
-            prompt = f"""Based on this W Formula calculation:
+    return f"""Based on this W Formula calculation:
             - Value Number: {result.value_number}
             - Recommendation: {result.recommendation}
             - Old Time: {inputs.get('old_time', {}).get('hours', 0)}h {inputs.get('old_time', {}).get('minutes', 0)}m
@@ -252,15 +1335,842 @@ async def generate_ai_insights(result: ValueNumberResult, inputs: dict) -> str:
             - New Effort: {inputs.get('new_effort', 0)}/10
             
             Provide specific financial insights and strategic recommendations for this investment decision."""
-        
-        user_message = UserMessage(text=prompt)
-        response = await chat.send_message(user_message)
-        
+
+# Long-lived insight LLM client
+INSIGHT_LLM_PROVIDER = os.environ.get('INSIGHT_LLM_PROVIDER', 'openai')
+INSIGHT_LLM_MODEL = os.environ.get('INSIGHT_LLM_MODEL', 'gpt-4o-mini')
+
+class InsightClient:
+    """Insight LLM client configured once at startup and shared by every request.
+
+    The Emergent key, provider, model and system prompt are resolved once. LlmChat keeps message
+    history per session and exposes no transport to share, so each call builds a fresh session.
+    """
+
+    def __init__(self, api_key: Optional[str], provider: str, model: str):
+        self.api_key = api_key
+        self.provider = provider
+        self.model = model
+        self.counters = {"calls": 0}
+
+    @classmethod
+    def from_env(cls) -> "InsightClient":
+        return cls(os.environ.get('EMERGENT_LLM_KEY'), INSIGHT_LLM_PROVIDER, INSIGHT_LLM_MODEL)
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def _new_session(self, provider: Optional[str] = None, model: Optional[str] = None) -> LlmChat:
+        return LlmChat(
+            api_key=self.api_key,
+            session_id=f"vn-insights-{uuid.uuid4()}",
+            system_message=INSIGHT_SYSTEM_MESSAGE
+        ).with_model(provider or self.provider, model or self.model)
+
+    async def complete(self, prompt: str, provider: Optional[str] = None, model: Optional[str] = None) -> str:
+        self.counters["calls"] += 1
+        return await self._new_session(provider, model).send_message(UserMessage(text=prompt))
+
+    def snapshot(self) -> dict:
+        return {**self.counters, "provider": self.provider, "model": self.model}
+
+insight_client = InsightClient.from_env()
+
+# Latency-aware model routing
+# Comma-separated provider:model routes; the first is the primary
+INSIGHT_MODEL_ROUTES = os.environ.get('INSIGHT_MODEL_ROUTES', f"{INSIGHT_LLM_PROVIDER}:{INSIGHT_LLM_MODEL}")
+# A p95 target, not a cutoff: INSIGHT_DEADLINE_SECONDS stays above it so an occasional slow call
+# still returns an insight, and only a sustained p95 above the SLO moves traffic off a route
+INSIGHT_LATENCY_SLO_MS = float(os.environ.get('INSIGHT_LATENCY_SLO_MS', '4000'))
+INSIGHT_ROUTE_WINDOW_SECONDS = float(os.environ.get('INSIGHT_ROUTE_WINDOW_SECONDS', '120'))
+# Most recent outcomes kept per route, so latency and error stats stay cheap to compute
+INSIGHT_ROUTE_MAX_SAMPLES = int(os.environ.get('INSIGHT_ROUTE_MAX_SAMPLES', '200'))
+# Routes failing more often than this, or slower than the SLO, are skipped once the window has enough samples
+INSIGHT_ROUTE_MAX_ERROR_RATE = float(os.environ.get('INSIGHT_ROUTE_MAX_ERROR_RATE', '0.2'))
+INSIGHT_ROUTE_MIN_SAMPLES = int(os.environ.get('INSIGHT_ROUTE_MIN_SAMPLES', '5'))
+# A healthy route over the SLO still gets one probe call this often, so it can show it has recovered
+INSIGHT_ROUTE_PROBE_SECONDS = float(os.environ.get('INSIGHT_ROUTE_PROBE_SECONDS', '15'))
+# Queue depths at which the router prefers the fastest model, and then skips the LLM entirely
+INSIGHT_PRESSURE_QUEUE_DEPTH = int(os.environ.get('INSIGHT_PRESSURE_QUEUE_DEPTH', '16'))
+INSIGHT_TEMPLATE_QUEUE_DEPTH = int(os.environ.get('INSIGHT_TEMPLATE_QUEUE_DEPTH', '48'))
+
+TEMPLATE_INSIGHTS = {
+    "strong_go": "Move ahead and schedule the training now; the value margin leaves room for setbacks. Track actual time saved over the first few weeks to confirm the estimate.",
+    "go": "Proceed, but confirm the training time and effort estimates with the people doing the work. A short pilot will show whether the benefit holds up in practice.",
+    "caution": "Treat this as marginal: look for ways to shorten training or lower the new effort before committing. Re-run the calculation once those estimates are firmer.",
+    "no_go": "Hold off on this change; the investment outweighs the expected return. Revisit it if the old process gets slower or the new one becomes easier to adopt.",
+}
+
+def template_insight(result: ValueNumberResult) -> str:
+    """Deterministic insight used when routing skips the LLM."""
+    return TEMPLATE_INSIGHTS.get(result.recommendation, INSIGHT_FALLBACK)
+
+class ModelRoute:
+    """A provider/model pair with a bounded window of recent call outcomes and its own circuit breaker."""
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self.samples: deque = deque()
+        self.failures = 0
+        # Latency percentiles over the current window, recomputed only after the window changes
+        self.percentiles: Dict[float, float] = {}
+        self.last_probe: Optional[float] = None
+        # Per route, so a broken alternate cannot shut off a healthy primary
+        self.breaker = CircuitBreaker(INSIGHT_BREAKER_FAILURES, INSIGHT_BREAKER_RESET_SECONDS)
+        self.counters = {"calls": 0, "errors": 0, "probes": 0}
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+    def record(self, seconds: float, ok: bool):
+        now = time.monotonic()
+        if len(self.samples) >= INSIGHT_ROUTE_MAX_SAMPLES:
+            self._drop_oldest()
+        self.samples.append((now, seconds * 1000, ok))
+        self.percentiles.clear()
+        self.counters["calls"] += 1
+        if not ok:
+            self.failures += 1
+            self.counters["errors"] += 1
+        self._prune(now)
+
+    def _drop_oldest(self):
+        _, _, ok = self.samples.popleft()
+        if not ok:
+            self.failures -= 1
+        self.percentiles.clear()
+
+    def _prune(self, now: float):
+        # Old samples age out, so a degraded route is retried once its window has passed
+        while self.samples and self.samples[0][0] < now - INSIGHT_ROUTE_WINDOW_SECONDS:
+            self._drop_oldest()
+
+    def percentile(self, q: float) -> Optional[float]:
+        self._prune(time.monotonic())
+        if not self.samples:
+            return None
+        if q not in self.percentiles:
+            self.percentiles[q] = float(np.percentile([ms for _, ms, _ in self.samples], q))
+        return self.percentiles[q]
+
+    def error_rate(self) -> Optional[float]:
+        """Share of failed calls in the window; None until there are enough samples to judge."""
+        self._prune(time.monotonic())
+        if len(self.samples) < INSIGHT_ROUTE_MIN_SAMPLES:
+            return None
+        return self.failures / len(self.samples)
+
+    def within_slo(self, slo_ms: float) -> bool:
+        """p95 latency within the SLO; true until there are enough samples to judge."""
+        self._prune(time.monotonic())
+        return len(self.samples) < INSIGHT_ROUTE_MIN_SAMPLES or self.percentile(95) <= slo_ms
+
+    def healthy(self) -> bool:
+        # Fast failures (auth errors, 4xx) would otherwise look like the quickest route
+        error_rate = self.error_rate()
+        return not self.breaker.is_open() and (error_rate is None or error_rate <= INSIGHT_ROUTE_MAX_ERROR_RATE)
+
+    def probe_due(self) -> bool:
+        """Claim this route's next probe slot if one is due."""
+        now = time.monotonic()
+        if self.last_probe is not None and now - self.last_probe < INSIGHT_ROUTE_PROBE_SECONDS:
+            return False
+        self.last_probe = now
+        self.counters["probes"] += 1
+        return True
+
+    def snapshot(self) -> dict:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        error_rate = self.error_rate()
+        return {
+            **self.counters,
+            "window_samples": len(self.samples),
+            "error_rate": round(error_rate, 4) if error_rate is not None else None,
+            "breaker": self.breaker.snapshot(),
+            "p50_ms": round(p50, 1) if p50 is not None else None,
+            "p95_ms": round(p95, 1) if p95 is not None else None,
+        }
+
+class InsightRouter:
+    """Pick the model for each insight from rolling p95 latency, error rate and LLM queue pressure.
+
+    Only healthy routes are considered: breaker closed and error rate within the limit. The primary
+    route is used while it is healthy, meets the SLO and the queue is short. Otherwise the fastest
+    healthy route within the SLO is used (routes with too few samples count as fast so they get
+    measured). A healthy route over the SLO gets a periodic probe call so it can recover. When no
+    route qualifies, or the queue is very deep, insights fall back to templates without calling the LLM.
+    """
+
+    def __init__(self, routes: List[ModelRoute], slo_ms: float):
+        self.routes = routes
+        self.slo_ms = slo_ms
+        self.decisions = {"primary": 0, "alternate": 0, "probe": 0, "template": 0}
+
+    @classmethod
+    def from_config(cls, config: str, slo_ms: float) -> "InsightRouter":
+        routes = []
+        for entry in config.split(','):
+            provider, _, model = entry.strip().partition(':')
+            if provider and model:
+                routes.append(ModelRoute(provider, model))
+        return cls(routes or [ModelRoute(INSIGHT_LLM_PROVIDER, INSIGHT_LLM_MODEL)], slo_ms)
+
+    def choose(self) -> Optional[ModelRoute]:
+        queued = insight_limiter.queued
+        if queued >= INSIGHT_TEMPLATE_QUEUE_DEPTH:
+            self.decisions["template"] += 1
+            return None
+        primary = self.routes[0]
+        if queued < INSIGHT_PRESSURE_QUEUE_DEPTH and primary.healthy() and primary.within_slo(self.slo_ms):
+            self.decisions["primary"] += 1
+            return primary
+        within_slo = []
+        for index, route in enumerate(self.routes):
+            if not route.healthy():
+                continue
+            if route.within_slo(self.slo_ms):
+                measured = len(route.samples) >= INSIGHT_ROUTE_MIN_SAMPLES
+                within_slo.append((route.percentile(95) if measured else 0.0, index))
+            elif queued < INSIGHT_PRESSURE_QUEUE_DEPTH and route.probe_due():
+                self.decisions["probe"] += 1
+                return route
+        if not within_slo:
+            self.decisions["template"] += 1
+            return None
+        route = self.routes[min(within_slo)[1]]
+        self.decisions["primary" if route is primary else "alternate"] += 1
+        return route
+
+    def snapshot(self) -> dict:
+        return {
+            "slo_ms": self.slo_ms,
+            "decisions": dict(self.decisions),
+            "routes": {route.name: route.snapshot() for route in self.routes},
+        }
+
+insight_router = InsightRouter.from_config(INSIGHT_MODEL_ROUTES, INSIGHT_LATENCY_SLO_MS)
+
+# Pluggable insight backends: live LLM, recording, or offline replay
+INSIGHT_BACKEND = os.environ.get('INSIGHT_BACKEND', 'live')
+INSIGHT_RECORDING_PATH = os.environ.get('INSIGHT_RECORDING_PATH', str(ROOT_DIR / 'insight_recordings.jsonl'))
+# "<default spec>;<model>=<spec>" where a spec is fixed:ms, uniform:low_ms:high_ms or lognormal:median_ms:sigma
+INSIGHT_REPLAY_LATENCY = os.environ.get('INSIGHT_REPLAY_LATENCY', 'lognormal:800:0.5')
+INSIGHT_REPLAY_SEED = os.environ.get('INSIGHT_REPLAY_SEED')
+
+def _prompt_digest(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+class LiveInsightBackend:
+    """Sends prompts to the Emergent LLM through the shared InsightClient."""
+
+    name = "live"
+
+    @property
+    def configured(self) -> bool:
+        return insight_client.configured
+
+    async def complete(self, prompt: str, route: ModelRoute) -> str:
+        return await insight_client.complete(prompt, route.provider, route.model)
+
+    def snapshot(self) -> dict:
+        return {"backend": self.name}
+
+class RecordingInsightBackend(LiveInsightBackend):
+    """Calls the live LLM and appends every prompt/response pair to a JSONL file for later replay."""
+
+    name = "record"
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.recorded = 0
+
+    async def complete(self, prompt: str, route: ModelRoute) -> str:
+        started = time.monotonic()
+        response = await super().complete(prompt, route)
+        line = json.dumps({
+            "prompt_sha256": _prompt_digest(prompt),
+            "prompt": prompt,
+            "response": response,
+            "provider": route.provider,
+            "model": route.model,
+            "latency_ms": round((time.monotonic() - started) * 1000, 1),
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+        })
+        await run_in_threadpool(self._append, line)
+        self.recorded += 1
         return response
-        
+
+    def _append(self, line: str):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def snapshot(self) -> dict:
+        return {"backend": self.name, "path": str(self.path), "recorded": self.recorded}
+
+class ReplayInsightBackend:
+    """Serves recorded responses with synthetic latency, so the insight path runs with no network.
+
+    Prompts that were never recorded get recorded responses round-robin, or a fixed placeholder
+    when the recording is empty.
+    """
+
+    name = "replay"
+    configured = True
+
+    def __init__(self, path: str, latency_config: str, seed: Optional[int] = None):
+        self.path = Path(path)
+        self.rng = np.random.default_rng(seed)
+        self.responses: Dict[str, str] = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.responses[entry["prompt_sha256"]] = entry["response"]
+        self.fallback_responses = list(self.responses.values())
+        self.latency = {}
+        for part in latency_config.split(';'):
+            model, _, spec = part.strip().rpartition('=')
+            self.latency[model or None] = self._parse_latency(spec)
+        self.counters = {"calls": 0, "exact_hits": 0, "substituted": 0}
+
+    @staticmethod
+    def _parse_latency(spec: str) -> tuple:
+        kind, *params = spec.split(':')
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2}
+        if kind not in expected or len(params) != expected[kind]:
+            raise ValueError(f"Invalid INSIGHT_REPLAY_LATENCY spec: {spec}")
+        return (kind, *map(float, params))
+
+    def sample_latency(self, model: str) -> float:
+        kind, *params = self.latency.get(model) or self.latency.get(None) or ("fixed", 0.0)
+        if kind == "fixed":
+            ms = params[0]
+        elif kind == "uniform":
+            ms = self.rng.uniform(params[0], params[1])
+        else:
+            ms = self.rng.lognormal(np.log(params[0]), params[1])
+        return ms / 1000
+
+    async def complete(self, prompt: str, route: ModelRoute) -> str:
+        self.counters["calls"] += 1
+        await asyncio.sleep(self.sample_latency(route.model))
+        response = self.responses.get(_prompt_digest(prompt))
+        if response is not None:
+            self.counters["exact_hits"] += 1
+            return response
+        self.counters["substituted"] += 1
+        if not self.fallback_responses:
+            return "Replayed insight: no recorded response for this scenario."
+        return self.fallback_responses[self.counters["substituted"] % len(self.fallback_responses)]
+
+    def snapshot(self) -> dict:
+        return {**self.counters, "backend": self.name, "path": str(self.path), "recorded_prompts": len(self.responses)}
+
+def _insight_backend_from_env():
+    if INSIGHT_BACKEND == "record":
+        return RecordingInsightBackend(INSIGHT_RECORDING_PATH)
+    if INSIGHT_BACKEND == "replay":
+        seed = int(INSIGHT_REPLAY_SEED) if INSIGHT_REPLAY_SEED else None
+        return ReplayInsightBackend(INSIGHT_RECORDING_PATH, INSIGHT_REPLAY_LATENCY, seed)
+    return LiveInsightBackend()
+
+insight_backend = _insight_backend_from_env()
+
+async def _request_llm_insight(prompt: str, route: ModelRoute) -> str:
+    started = time.monotonic()
+    ok = False
+    try:
+        insight = await insight_backend.complete(prompt, route)
+        ok = True
+        return insight
+    finally:
+        # Failures and deadline cancellations are recorded too: slow ones raise the route's p95,
+        # fast ones raise its error rate, and either takes it out of the router's choice
+        route.record(time.monotonic() - started, ok)
+
+async def _stream_llm_insight(prompt: str, route: ModelRoute) -> AsyncIterator[str]:
+    # LlmChat returns the whole answer at once, so it arrives as a single chunk
+    yield await _request_llm_insight(prompt, route)
+
+async def _guarded_insight_stream(prompt: str, route: ModelRoute, deadline_seconds: float = INSIGHT_DEADLINE_SECONDS) -> AsyncIterator[str]:
+    """Stream an LLM answer within the concurrency limit, the per-call deadline and the route's circuit breaker."""
+    breaker = route.breaker
+    # Fail fast without queueing while the breaker is open
+    if breaker.is_open():
+        breaker.counters["short_circuited"] += 1
+        raise InsightUnavailable(f"LLM circuit breaker for {route.name} is open")
+    deadline = time.monotonic() + deadline_seconds
+    async with insight_limiter.slot(deadline_seconds):
+        if not breaker.allow():
+            raise InsightUnavailable(f"LLM circuit breaker for {route.name} is open")
+        chunks = _stream_llm_insight(prompt, route)
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), max(deadline - time.monotonic(), 0.001))
+                except StopAsyncIteration:
+                    break
+                yield chunk
+        except Exception:
+            breaker.record_failure()
+            raise
+        finally:
+            breaker.release()
+            await chunks.aclose()
+        breaker.record_success()
+
+async def _guarded_insight_call(prompt: str, route: ModelRoute, deadline_seconds: float = INSIGHT_DEADLINE_SECONDS) -> str:
+    return "".join([chunk async for chunk in _guarded_insight_stream(prompt, route, deadline_seconds)])
+
+# Batched insight generation
+INSIGHT_BATCH_WINDOW_MS = float(os.environ.get('INSIGHT_BATCH_WINDOW_MS', '50'))
+INSIGHT_BATCH_MAX_SIZE = int(os.environ.get('INSIGHT_BATCH_MAX_SIZE', '10'))
+# A batched answer is N insights long, so its deadline grows with every scenario after the first
+INSIGHT_BATCH_DEADLINE_PER_ITEM_SECONDS = float(os.environ.get('INSIGHT_BATCH_DEADLINE_PER_ITEM_SECONDS', '2'))
+
+def batch_deadline_seconds(count: int) -> float:
+    return INSIGHT_DEADLINE_SECONDS + INSIGHT_BATCH_DEADLINE_PER_ITEM_SECONDS * (count - 1)
+
+def build_batch_insight_prompt(prompts: List[str]) -> str:
+    scenarios = "\n\n".join(f"Scenario {i}:\n{prompt}" for i, prompt in enumerate(prompts, 1))
+    return f"""Provide insights for each of the following {len(prompts)} Value Number™ scenarios, following the instructions in each scenario.
+            Respond only with a JSON array of {len(prompts)} strings, where element i is the insight for Scenario i.
+
+            {scenarios}"""
+
+def parse_batch_insights(answer: str, count: int) -> Optional[List[str]]:
+    """Split a batched LLM answer into per-scenario insights; None if it is not the expected JSON array."""
+    start, end = answer.find("["), answer.rfind("]")
+    if start < 0 or end < start:
+        return None
+    try:
+        insights = json.loads(answer[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(insights, list) or len(insights) != count or not all(isinstance(i, str) and i.strip() for i in insights):
+        return None
+    return [i.strip() for i in insights]
+
+class InsightBatcher:
+    """Collect insight prompts for a short window (or up to a maximum size) and answer them with one LLM call."""
+
+    def __init__(self, window_seconds: float, max_size: int):
+        self.window_seconds = window_seconds
+        self.max_size = max_size
+        self.pending: List[tuple] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.counters = {"submitted": 0, "batches": 0, "batched_prompts": 0, "parse_fallbacks": 0, "failed_batches": 0}
+
+    async def submit(self, prompt: str) -> str:
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((prompt, future))
+        self.counters["submitted"] += 1
+        if len(self.pending) >= self.max_size:
+            self._flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.window_seconds, self._flush)
+        return await future
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        items, self.pending = self.pending, []
+        if items:
+            _spawn(self._answer(items))
+
+    async def _answer(self, items: List[tuple]):
+        prompts = [prompt for prompt, _ in items]
+        try:
+            route = insight_router.choose()
+            if route is None:
+                raise InsightUnavailable("Insight router chose template-only insights")
+            if len(items) == 1:
+                insights = [await _guarded_insight_call(prompts[0], route)]
+            else:
+                answer = await _guarded_insight_call(build_batch_insight_prompt(prompts), route, batch_deadline_seconds(len(items)))
+                self.counters["batches"] += 1
+                self.counters["batched_prompts"] += len(items)
+                insights = parse_batch_insights(answer, len(items))
+                if insights is None:
+                    # The call succeeded but the answer was malformed: ask for each scenario on its own
+                    self.counters["parse_fallbacks"] += 1
+                    insights = await asyncio.gather(*[_guarded_insight_call(prompt, route) for prompt in prompts], return_exceptions=True)
+        except Exception as e:
+            # Breaker open, queue full, deadline passed or the call failed: retrying per item would only
+            # repeat the failure and stretch the caller's deadline, so every waiter gets the error
+            if not isinstance(e, InsightUnavailable):
+                self.counters["failed_batches"] += 1
+                logging.error(f"Batched AI insights failed: {str(e) or type(e).__name__}")
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), insight in zip(items, insights):
+            if future.done():
+                continue
+            if isinstance(insight, BaseException):
+                future.set_exception(insight)
+            else:
+                future.set_result(insight)
+
+    def snapshot(self) -> dict:
+        return {**self.counters, "pending": len(self.pending)}
+
+insight_batcher = InsightBatcher(INSIGHT_BATCH_WINDOW_MS / 1000, INSIGHT_BATCH_MAX_SIZE)
+
+async def generate_ai_insights(result: ValueNumberResult, inputs: dict, batched: bool = False) -> str:
+    """Generate AI-powered insights and recommendations based on calculation results.
+
+    With batched=True the prompt may share one LLM call with other pending insight requests.
+    """
+    cache_key = insight_cache_key(result, inputs)
+    cached = await _cached_insight(result, inputs, cache_key)
+    if cached is not None:
+        return cached
+
+    if not insight_backend.configured:
+        return "AI insights unavailable - API key not configured."
+
+    prompt = build_insight_prompt(result, inputs)
+
+    async def fetch_and_store() -> str:
+        if batched:
+            insight = await insight_batcher.submit(prompt)
+        else:
+            route = insight_router.choose()
+            if route is None:
+                return template_insight(result)
+            insight = await _guarded_insight_call(prompt, route)
+        await _store_insight(result, inputs, cache_key, insight)
+        return insight
+
+    try:
+        # Identical concurrent prompts share one upstream LLM call
+        return await insight_flight.run(_prompt_digest(prompt), fetch_and_store)
+    except InsightUnavailable as e:
+        # The deterministic explanation already in the result stands on its own
+        logging.warning(f"AI insights skipped: {str(e)}")
+        return INSIGHT_FALLBACK
+    except asyncio.TimeoutError:
+        logging.warning(f"AI insights timed out after {INSIGHT_DEADLINE_SECONDS}s")
+        return INSIGHT_FALLBACK
     except Exception as e:
         logging.error(f"AI insights generation failed: {str(e)}")
-        return "AI insights temporarily unavailable. The mathematical analysis above provides reliable guidance for your decision."
+        return INSIGHT_FALLBACK
+
+
+async def stream_ai_insights(result: ValueNumberResult, inputs: dict) -> AsyncIterator[str]:
+    """Yield AI insight text as it arrives; cache hits and fallbacks arrive as one chunk."""
+    cache_key = insight_cache_key(result, inputs)
+    cached = await _cached_insight(result, inputs, cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    if not insight_backend.configured:
+        yield "AI insights unavailable - API key not configured."
+        return
+
+    route = insight_router.choose()
+    if route is None:
+        yield template_insight(result)
+        return
+
+    chunks = []
+    try:
+        async for chunk in _guarded_insight_stream(build_insight_prompt(result, inputs), route):
+            chunks.append(chunk)
+            yield chunk
+    except InsightUnavailable as e:
+        logging.warning(f"AI insights skipped: {str(e)}")
+    except asyncio.TimeoutError:
+        logging.warning(f"AI insights timed out after {INSIGHT_DEADLINE_SECONDS}s")
+    except Exception as e:
+        logging.error(f"AI insights streaming failed: {str(e)}")
+    if not chunks:
+        yield INSIGHT_FALLBACK
+        return
+    await _store_insight(result, inputs, cache_key, "".join(chunks))
+
+# Deferred AI insight jobs
+INSIGHT_JOB_TTL_SECONDS = int(os.environ.get('INSIGHT_JOB_TTL_SECONDS', '900'))
+INSIGHT_JOB_MAX = int(os.environ.get('INSIGHT_JOB_MAX', '10000'))
+INSIGHT_SSE_KEEPALIVE_SECONDS = 15
+
+class InsightJobStatus(BaseModel):
+    job_id: str
+    status: str
+    insight: Optional[str] = None
+    created_at: str
+
+class InsightJob:
+    """In-process handle for an insight generated after the numeric result was returned."""
+
+    def __init__(self):
+        self.id = str(uuid.uuid4())
+        self.status = "pending"
+        self.insight: Optional[str] = None
+        self.record: Optional[dict] = None
+        # Resolves once the record has been written by the write-behind buffer
+        self.saved: Optional[asyncio.Future] = None
+        self.created_at = datetime.now(timezone.utc).isoformat()
+        self.created = time.monotonic()
+        self.done = asyncio.Event()
+
+    def status_model(self) -> InsightJobStatus:
+        return InsightJobStatus(job_id=self.id, status=self.status, insight=self.insight, created_at=self.created_at)
+
+_insight_jobs: "OrderedDict[str, InsightJob]" = OrderedDict()
+_background_tasks: set = set()
+
+def _spawn(coro) -> asyncio.Task:
+    # Hold a reference so fire-and-forget tasks are not garbage collected mid-flight
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+def _prune_insight_jobs():
+    cutoff = time.monotonic() - INSIGHT_JOB_TTL_SECONDS
+    while _insight_jobs:
+        oldest = next(iter(_insight_jobs.values()))
+        if oldest.created >= cutoff and len(_insight_jobs) <= INSIGHT_JOB_MAX:
+            break
+        _insight_jobs.popitem(last=False)
+
+def _get_insight_job(job_id: str) -> InsightJob:
+    job = _insight_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Insight job not found or expired")
+    return job
+
+async def _run_insight_job(job: InsightJob, result: ValueNumberResult, inputs: dict):
+    try:
+        # Nobody is waiting on the response, so deferred insights can share batched LLM calls
+        job.insight = await generate_ai_insights(result, inputs, batched=True)
+        job.status = "ready"
+    except Exception as e:
+        logging.error(f"Insight job {job.id} failed: {str(e)}")
+        job.insight = INSIGHT_FALLBACK
+        job.status = "failed"
+
+    if job.record is not None:
+        explanation = f"{job.record['result']['explanation']}\n\n🤖 AI Insights: {job.insight}"
+        # Patch the record in place too, in case it has not reached Mongo yet
+        job.record["ai_insights"] = job.insight
+        job.record["insight_status"] = job.status
+        job.record["result"]["explanation"] = explanation
+        try:
+            # The update must not overtake the buffered insert it patches
+            if job.saved is not None:
+                await job.saved
+            await db.calculations.update_one(
+                {"insight_job_id": job.id},
+                {"$set": {"ai_insights": job.insight, "insight_status": job.status, "result.explanation": explanation}}
+            )
+        except Exception as e:
+            logging.error(f"Failed to store insight for job {job.id}: {str(e)}")
+    job.done.set()
+
+def start_insight_job(job: InsightJob, result: ValueNumberResult, inputs: dict) -> InsightJob:
+    _prune_insight_jobs()
+    _insight_jobs[job.id] = job
+    _spawn(_run_insight_job(job, result, inputs))
+    return job
+
+# Write-behind persistence: calculation records are batched into insert_many off the request path
+CALCULATION_WRITE_BATCH_SIZE = int(os.environ.get('CALCULATION_WRITE_BATCH_SIZE', '100'))
+CALCULATION_WRITE_FLUSH_SECONDS = float(os.environ.get('CALCULATION_WRITE_FLUSH_SECONDS', '0.5'))
+CALCULATION_WRITE_MAX_QUEUE = int(os.environ.get('CALCULATION_WRITE_MAX_QUEUE', '10000'))
+# How long a request waits for queue space before writing its record inline instead
+CALCULATION_WRITE_ENQUEUE_TIMEOUT_SECONDS = float(os.environ.get('CALCULATION_WRITE_ENQUEUE_TIMEOUT_SECONDS', '2'))
+CALCULATION_WRITE_RETRIES = int(os.environ.get('CALCULATION_WRITE_RETRIES', '3'))
+
+class WriteBehindBuffer:
+    """Bounded queue of documents flushed to one collection in batches, by size or after a delay.
+
+    A full queue makes callers wait (backpressure) and, past the enqueue timeout, write inline, so
+    records are never dropped for lack of space. close() drains everything still queued.
+    """
+
+    def __init__(self, collection: str, batch_size: int, flush_seconds: float, max_queue: int,
+                 enqueue_timeout: float, retries: int, after_write=None):
+        self.collection = collection
+        # Optional coroutine function called with each batch's written documents
+        self.after_write = after_write
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_queue = max_queue
+        self.enqueue_timeout = enqueue_timeout
+        self.retries = retries
+        self.queue: Optional[asyncio.Queue] = None
+        self.flusher: Optional[asyncio.Task] = None
+        # Set by close(); the flusher drains the queue and returns, and later puts write inline
+        self.closing = False
+        self.counters = {
+            "enqueued": 0, "written": 0, "batches": 0, "backpressure_waits": 0,
+            "inline_writes": 0, "retries": 0, "failed": 0,
+        }
+
+    def _ensure_started(self):
+        if self.flusher is None:
+            self.queue = asyncio.Queue(maxsize=self.max_queue)
+            self.flusher = asyncio.create_task(self._flush_forever())
+
+    async def put(self, document: dict) -> asyncio.Future:
+        """Queue a document; the returned future resolves to True once it is written."""
+        saved = asyncio.get_running_loop().create_future()
+        item = (document, saved)
+        if self.closing:
+            # The flusher is stopping (or gone), so write this one ourselves rather than restart it
+            self.counters["inline_writes"] += 1
+            await self._write([item])
+            return saved
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.counters["backpressure_waits"] += 1
+            try:
+                await asyncio.wait_for(self.queue.put(item), self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.counters["inline_writes"] += 1
+                await self._write([item])
+                return saved
+        self.counters["enqueued"] += 1
+        return saved
+
+    async def _collect_batch(self) -> list:
+        # None is the wake-up sentinel from close(), not a record
+        batch = [item for item in [await self.queue.get()] if item is not None]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            if self.closing:
+                # Shutting down: take what is already queued without waiting out the delay
+                while len(batch) < self.batch_size and not self.queue.empty():
+                    item = self.queue.get_nowait()
+                    if item is not None:
+                        batch.append(item)
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if item is not None:
+                batch.append(item)
+        return batch
+
+    async def _flush_forever(self):
+        # Never cancelled: close() sets closing and wakes us, and we return once the queue is empty
+        while not (self.closing and self.queue.empty()):
+            batch = await self._collect_batch()
+            if batch:
+                await self._write(batch)
+
+    async def _write(self, batch: list):
+        documents = [document for document, _ in batch]
+        failed = set()
+        for attempt in range(self.retries + 1):
+            try:
+                # insert_many assigns _ids in place, so a retry after a lost reply reports duplicates instead of writing twice
+                await db[self.collection].insert_many(documents, ordered=False)
+                break
+            except BulkWriteError as e:
+                errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+                failed = {error["index"] for error in errors}
+                if errors:
+                    logging.error(f"Failed to write {len(errors)} {self.collection} records: {errors[0].get('errmsg')}")
+                break
+            except Exception as e:
+                if attempt == self.retries:
+                    failed = set(range(len(documents)))
+                    logging.error(f"Failed to write {len(documents)} {self.collection} records: {str(e)}")
+                    break
+                self.counters["retries"] += 1
+                await asyncio.sleep(0.1 * 2 ** attempt)
+        written = [document for i, document in enumerate(documents) if i not in failed]
+        self.counters["written"] += len(written)
+        self.counters["failed"] += len(failed)
+        self.counters["batches"] += 1
+        if written and self.after_write is not None:
+            try:
+                await self.after_write(written)
+            except Exception as e:
+                logging.error(f"After-write hook for {self.collection} failed: {str(e)}")
+        for i, (_, saved) in enumerate(batch):
+            if not saved.done():
+                saved.set_result(i not in failed)
+
+    async def close(self):
+        self.closing = True
+        if self.flusher is None:
+            return
+        pending = self.queue.qsize()
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass  # a full queue keeps the flusher busy until it sees closing
+        await self.flusher
+        self.flusher = None
+        if pending:
+            logging.info(f"Flushed {pending} buffered {self.collection} records on shutdown")
+
+    def snapshot(self) -> dict:
+        return {
+            **self.counters,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "max_queue": self.max_queue,
+            "batch_size": self.batch_size,
+            "flush_seconds": self.flush_seconds,
+        }
+
+# Calculation rollups: per-user and global counters bucketed by UTC day, kept current with $inc
+ROLLUP_ALL_TIME = "all-time"  # sorts after every YYYY-MM-DD day, so one range read covers both
+ROLLUP_GLOBAL_SCOPE = "global"
+ROLLUP_MAX_DAYS = 366
+
+def rollup_increments(records: List[dict]) -> Dict[tuple, dict]:
+    """Fold records into per-(scope, day) $inc/$min/$max updates, one per rollup document."""
+    updates: Dict[tuple, dict] = {}
+    for record in records:
+        value = record["result"]["value_number"]
+        kind = record["calculation_type"]
+        recommendation = record["result"]["recommendation"]
+        for scope in (f"user:{record['user_id']}", ROLLUP_GLOBAL_SCOPE):
+            for day in (record["timestamp"][:10], ROLLUP_ALL_TIME):
+                update = updates.setdefault((scope, day), {"$inc": {}, "$min": {}, "$max": {}})
+                inc = update["$inc"]
+                for field, amount in (
+                    ("count", 1), ("value_number_sum", value),
+                    (f"by_type.{kind}.count", 1), (f"by_type.{kind}.value_number_sum", value),
+                    (f"by_recommendation.{recommendation}", 1),
+                ):
+                    inc[field] = inc.get(field, 0) + amount
+                update["$min"]["value_number_min"] = min(update["$min"].get("value_number_min", value), value)
+                update["$max"]["value_number_max"] = max(update["$max"].get("value_number_max", value), value)
+    return updates
+
+async def update_calculation_rollups(records: List[dict]):
+    # One bulk round trip per written batch; $inc is not idempotent, so a failed batch is not retried
+    await db.calculation_rollups.bulk_write([
+        UpdateOne({"_id": f"{scope}|{day}"}, {**update, "$setOnInsert": {"scope": scope, "day": day}}, upsert=True)
+        for (scope, day), update in rollup_increments(records).items()
+    ], ordered=False)
+
+calculation_writer = WriteBehindBuffer(
+    "calculations", CALCULATION_WRITE_BATCH_SIZE, CALCULATION_WRITE_FLUSH_SECONDS,
+    CALCULATION_WRITE_MAX_QUEUE, CALCULATION_WRITE_ENQUEUE_TIMEOUT_SECONDS, CALCULATION_WRITE_RETRIES,
+    after_write=update_calculation_rollups
+)
 
 
 # Define Models
@@ -279,7 +2189,9 @@ async def root():
 
 # Value Number™ Authentication Endpoints
 @api_router.post("/register", response_model=UserResponse)
-async def register_user(user_data: UserCreate):
+async def register_user(user_data: UserCreate, request: Request):
+    enforce_auth_rate_limits(request, "register", user_data.email)
+    
     # Check if user already exists
     existing_user = await db.users.find_one({"email": user_data.email})
     if existing_user:
@@ -288,7 +2200,7 @@ async def register_user(user_data: UserCreate):
     # Create new user
     user = User(
         email=user_data.email,
-        password_hash=hash_password(user_data.password)
+        password_hash=await hash_password_async(user_data.password)
     )
     
     # Save to database
@@ -296,8 +2208,18 @@ async def register_user(user_data: UserCreate):
     
     return UserResponse(**user.dict())
 
+async def _rehash_password(user_id: str, password: str):
+    try:
+        await update_user(user_id, {"password_hash": await hash_password_async(password)})
+        password_cost.counters["rehashed"] += 1
+    except Exception as e:
+        password_cost.counters["rehash_failures"] += 1
+        logging.warning(f"Failed to rehash password for user {user_id}: {str(e)}")
+
 @api_router.post("/login")
-async def login_user(login_data: UserLogin):
+async def login_user(login_data: UserLogin, request: Request):
+    enforce_auth_rate_limits(request, "login", login_data.email)
+    
     # Find user by email
     user_data = await db.users.find_one({"email": login_data.email})
     if not user_data:
@@ -306,27 +2228,46 @@ async def login_user(login_data: UserLogin):
     user = User(**user_data)
     
     # Verify password
-    if not verify_password(login_data.password, user.password_hash):
+    if not await verify_password_async(login_data.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     if not user.is_active:
         raise HTTPException(status_code=401, detail="Account is disabled")
     
-    # Create access token
-    access_token = create_access_token(data={"sub": user.id})
+    # Move the stored hash to the current cost without delaying this login
+    if password_cost.needs_rehash(user.password_hash):
+        _spawn(_rehash_password(user.id, login_data.password))
+    
+    # Create access and refresh tokens
+    tokens = await issue_tokens(user)
     
     return {
-        "access_token": access_token,
-        "token_type": "bearer",
+        **tokens,
         "user": UserResponse(**user.dict())
     }
 
+@api_router.post("/token/refresh")
+async def refresh_access_token(request: RefreshRequest):
+    return await rotate_refresh_token(request.refresh_token)
+
 @api_router.get("/me", response_model=UserResponse)
-async def get_current_user_info(current_user: User = Depends(get_current_user)):
+async def get_current_user_info(current_user: AuthPrincipal = Depends(get_current_user)):
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     return UserResponse(**current_user.dict())
 
+@api_router.post("/logout")
+async def logout_user(request: Optional[RefreshRequest] = None, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    payload = decode_access_token(credentials.credentials) if credentials else None
+    if payload is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    # Tokens without an id cannot be revoked; they simply run until they expire
+    if payload.get("fmt") == STATELESS_TOKEN_FORMAT:
+        await token_revocations.revoke_token(payload)
+    if request is not None:
+        await revoke_refresh_token(request.refresh_token)
+    return {"message": "Logged out"}
+
 # Value Number™ Passcode Verification
 @api_router.post("/verify-passcode")
 async def verify_passcode(passcode: str):
@@ -335,59 +2276,529 @@ async def verify_passcode(passcode: str):
     return {"valid": is_valid}
 
 # Value Number™ Calculator Endpoints with AI Insights
-@api_router.post("/calculate/s-formula", response_model=ValueNumberResult)
-async def calculate_s(inputs: ValueNumberInputS, current_user: Optional[User] = Depends(get_current_user)):
-    try:
-        result = calculate_s_formula(inputs)
-        
+def _calculation_record(result: ValueNumberResult, inputs: dict, current_user: AuthPrincipal, ai_insights: Optional[str]) -> dict:
+    return {
+        "user_id": current_user.id,
+        "calculation_type": result.calculation_type,
+        "inputs": inputs,
+        "result": result.dict(exclude_none=True),
+        "ai_insights": ai_insights,
+        "timestamp": result.timestamp
+    }
+
+async def _save_calculation(record: dict) -> asyncio.Future:
+    return await calculation_writer.put(record)
+
+async def _complete_calculation(result: ValueNumberResult, inputs: dict, current_user: Optional[AuthPrincipal], async_insights: bool) -> ValueNumberResult:
+    """Attach AI insights to a calculation result and save it for authenticated users.
+
+    With async_insights the numeric result is returned immediately together with an insight job id;
+    the insight is generated in the background and patched into the stored record when ready.
+    """
+    job = None
+    if async_insights:
+        job = InsightJob()
+        result.insight_job_id = job.id
+        ai_insights = None
+    else:
         # Generate AI insights
-        ai_insights = await generate_ai_insights(result, inputs.dict())
-        
+        ai_insights = await generate_ai_insights(result, inputs)
+
         # Enhance explanation with AI insights
         result.explanation = f"{result.explanation}\n\n🤖 AI Insights: {ai_insights}"
-        
-        # Save calculation if user is authenticated
-        if current_user:
-            calculation_record = {
-                "user_id": current_user.id,
-                "calculation_type": "s_formula",
-                "inputs": inputs.dict(),
-                "result": result.dict(),
-                "ai_insights": ai_insights,
-                "timestamp": result.timestamp
-            }
-            await db.calculations.insert_one(calculation_record)
-        
-        return result
+
+    # Save calculation if user is authenticated
+    if current_user:
+        calculation_record = _calculation_record(result, inputs, current_user, ai_insights)
+        if job is not None:
+            calculation_record["insight_job_id"] = job.id
+            calculation_record["insight_status"] = "pending"
+            job.record = calculation_record
+        saved = await _save_calculation(calculation_record)
+        if job is not None:
+            job.saved = saved
+
+    if job is not None:
+        start_insight_job(job, result.copy(), inputs)
+    return result
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _stream_calculation(result: ValueNumberResult, inputs: dict, current_user: Optional[AuthPrincipal]) -> StreamingResponse:
+    """Send the numeric result as the first SSE event, then the AI insight chunks, then a done event."""
+
+    async def events():
+        yield _sse_event("result", result.dict(exclude_none=True))
+        chunks = []
+        try:
+            async for chunk in stream_ai_insights(result, inputs):
+                chunks.append(chunk)
+                yield _sse_event("insight", {"text": chunk})
+            ai_insights = "".join(chunks)
+            result.explanation = f"{result.explanation}\n\n🤖 AI Insights: {ai_insights}"
+            yield _sse_event("done", {"explanation": result.explanation, "saved": current_user is not None})
+        finally:
+            # Persist once the stream ends, even if the client disconnected part-way through
+            if current_user:
+                _spawn(_save_calculation(_calculation_record(result, inputs, current_user, "".join(chunks) or None)))
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@api_router.post("/calculate/s-formula", response_model=ValueNumberResult, response_model_exclude_none=True)
+async def calculate_s(inputs: ValueNumberInputS, async_insights: bool = False, current_user: Optional[AuthPrincipal] = Depends(get_current_user)):
+    try:
+        result = calculate_s_formula(inputs)
+        return await _complete_calculation(result, inputs.dict(), current_user, async_insights)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@api_router.post("/calculate/w-formula", response_model=ValueNumberResult)
-async def calculate_w(inputs: ValueNumberInputW, current_user: Optional[User] = Depends(get_current_user)):
+@api_router.post("/calculate/w-formula", response_model=ValueNumberResult, response_model_exclude_none=True)
+async def calculate_w(inputs: ValueNumberInputW, async_insights: bool = False, current_user: Optional[AuthPrincipal] = Depends(get_current_user)):
     try:
         result = calculate_w_formula(inputs)
-        
-        # Generate AI insights
-        ai_insights = await generate_ai_insights(result, inputs.dict())
-        
-        # Enhance explanation with AI insights
-        result.explanation = f"{result.explanation}\n\n🤖 AI Insights: {ai_insights}"
-        
-        # Save calculation if user is authenticated
-        if current_user:
-            calculation_record = {
-                "user_id": current_user.id,
-                "calculation_type": "w_formula", 
-                "inputs": inputs.dict(),
-                "result": result.dict(),
-                "ai_insights": ai_insights,
-                "timestamp": result.timestamp
-            }
-            await db.calculations.insert_one(calculation_record)
-        
-        return result
+        return await _complete_calculation(result, inputs.dict(), current_user, async_insights)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.post("/calculate/s-formula/stream")
+async def calculate_s_stream(inputs: ValueNumberInputS, current_user: Optional[AuthPrincipal] = Depends(get_current_user)):
+    try:
+        result = calculate_s_formula(inputs)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    return _stream_calculation(result, inputs.dict(), current_user)
+
+@api_router.post("/calculate/w-formula/stream")
+async def calculate_w_stream(inputs: ValueNumberInputW, current_user: Optional[AuthPrincipal] = Depends(get_current_user)):
+    try:
+        result = calculate_w_formula(inputs)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _stream_calculation(result, inputs.dict(), current_user)
+
+@api_router.get("/insights/{job_id}", response_model=InsightJobStatus, response_model_exclude_none=True)
+async def get_insight_job(job_id: str):
+    return _get_insight_job(job_id).status_model()
+
+@api_router.get("/insights/{job_id}/stream")
+async def stream_insight_job(job_id: str):
+    job = _get_insight_job(job_id)
+
+    async def events():
+        # Keep-alive comments hold the connection open until the insight is ready
+        waiter = asyncio.ensure_future(job.done.wait())
+        try:
+            while not (await asyncio.wait({waiter}, timeout=INSIGHT_SSE_KEEPALIVE_SECONDS))[0]:
+                yield ": keep-alive\n\n"
+        finally:
+            waiter.cancel()
+        yield _sse_event("insight", job.status_model().dict(exclude_none=True))
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# Calculation history: keyset pages over (user_id, timestamp, _id), newest first
+HISTORY_PAGE_MAX = 100
+HISTORY_PROJECTION = {
+    "_id": 1, "calculation_type": 1, "timestamp": 1, "insight_status": 1,
+    "result.value_number": 1, "result.recommendation": 1,
+}
+
+class CalculationSummary(BaseModel):
+    id: str
+    calculation_type: str
+    value_number: float
+    recommendation: str
+    timestamp: str
+    insight_status: Optional[str] = None
+
+def encode_history_cursor(doc: dict) -> str:
+    position = json.dumps({"t": doc["timestamp"], "id": str(doc["_id"])})
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+def decode_history_cursor(cursor: str) -> dict:
+    """Turn a cursor into the filter for everything strictly after that row in history order."""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        timestamp, last_id = position["t"], ObjectId(position["id"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid history cursor")
+    return {"$or": [
+        {"timestamp": {"$lt": timestamp}},
+        {"timestamp": timestamp, "_id": {"$lt": last_id}},
+    ]}
+
+def calculation_summary(doc: dict) -> CalculationSummary:
+    return CalculationSummary(
+        id=str(doc["_id"]),
+        calculation_type=doc["calculation_type"],
+        value_number=doc["result"]["value_number"],
+        recommendation=doc["result"]["recommendation"],
+        timestamp=doc["timestamp"],
+        insight_status=doc.get("insight_status"),
+    )
+
+@api_router.get("/calculations/history", response_model=List[CalculationSummary], response_model_exclude_none=True)
+async def get_calculation_history(
+    response: Response,
+    limit: int = Query(20, ge=1, le=HISTORY_PAGE_MAX),
+    cursor: Optional[str] = None,
+    calculation_type: Optional[Literal["s_formula", "w_formula"]] = None,
+    recommendation: Optional[Literal["no_go", "caution", "go", "strong_go"]] = None,
+    current_user: Optional[AuthPrincipal] = Depends(get_current_user)
+):
+    """One page of the caller's calculations; the next page's cursor is in the X-Next-Cursor header."""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    query = {"user_id": current_user.id}
+    if calculation_type:
+        query["calculation_type"] = calculation_type
+    if recommendation:
+        query["result.recommendation"] = recommendation
+    if cursor:
+        query.update(decode_history_cursor(cursor))
+
+    # One extra row tells us whether another page exists
+    docs = await db.calculations.find(query, HISTORY_PROJECTION).sort(
+        [("timestamp", -1), ("_id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers["X-Next-Cursor"] = encode_history_cursor(docs[-1])
+    return [calculation_summary(doc) for doc in docs]
+
+class RollupTypeStats(BaseModel):
+    count: int
+    average_value_number: float
+
+class RollupBucket(BaseModel):
+    day: str
+    count: int
+    average_value_number: float
+    min_value_number: float
+    max_value_number: float
+    by_type: Dict[str, RollupTypeStats]
+    by_recommendation: Dict[str, int]
+
+class CalculationRollups(BaseModel):
+    all_time: Optional[RollupBucket] = None
+    days: List[RollupBucket]
+
+def rollup_bucket(doc: dict) -> RollupBucket:
+    return RollupBucket(
+        day=doc["day"],
+        count=doc["count"],
+        average_value_number=round(doc["value_number_sum"] / doc["count"], 4),
+        min_value_number=doc["value_number_min"],
+        max_value_number=doc["value_number_max"],
+        by_type={
+            kind: RollupTypeStats(count=stats["count"], average_value_number=round(stats["value_number_sum"] / stats["count"], 4))
+            for kind, stats in doc.get("by_type", {}).items()
+        },
+        by_recommendation=doc.get("by_recommendation", {}),
+    )
+
+async def read_rollups(scope: str, days: int) -> CalculationRollups:
+    first_day = (datetime.now(timezone.utc) - timedelta(days=days - 1)).date().isoformat()
+    # A single range read on (scope, day) returns the daily buckets and the all-time bucket after them
+    docs = await db.calculation_rollups.find(
+        {"scope": scope, "day": {"$gte": first_day}}
+    ).sort("day", 1).to_list(days + 1)
+    buckets = [rollup_bucket(doc) for doc in docs]
+    all_time = buckets.pop() if buckets and buckets[-1].day == ROLLUP_ALL_TIME else None
+    return CalculationRollups(all_time=all_time, days=buckets)
+
+@api_router.get("/calculations/rollups", response_model=CalculationRollups, response_model_exclude_none=True)
+async def get_calculation_rollups(
+    days: int = Query(30, ge=1, le=ROLLUP_MAX_DAYS),
+    current_user: Optional[AuthPrincipal] = Depends(get_current_user)
+):
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await read_rollups(f"user:{current_user.id}", days)
+
+@api_router.get("/admin/rollups", response_model=CalculationRollups, response_model_exclude_none=True)
+async def get_global_rollups(days: int = Query(30, ge=1, le=ROLLUP_MAX_DAYS), admin: AuthPrincipal = Depends(require_admin)):
+    return await read_rollups(ROLLUP_GLOBAL_SCOPE, days)
+
+# Calculation export: rows streamed straight off a Motor cursor, oldest first, in fixed-size chunks
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '500'))
+EXPORT_PROJECTION = {"user_id": 0}
+EXPORT_CSV_COLUMNS = [
+    "id", "timestamp", "calculation_type", "value_number", "recommendation",
+    "insight_status", "ai_insights", "explanation", "inputs",
+]
+EXPORT_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+def export_row(doc: dict) -> dict:
+    result = doc.get("result", {})
+    return {
+        "id": str(doc["_id"]),
+        "timestamp": doc["timestamp"],
+        "calculation_type": doc["calculation_type"],
+        "value_number": result.get("value_number"),
+        "recommendation": result.get("recommendation"),
+        "insight_status": doc.get("insight_status"),
+        "ai_insights": doc.get("ai_insights"),
+        "explanation": result.get("explanation"),
+        "inputs": doc.get("inputs"),
+    }
+
+def _csv_text(lines: List[list]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(lines)
+    return buffer.getvalue()
+
+def format_export_rows(rows: List[dict], format: str) -> str:
+    if format == "ndjson":
+        return "".join(json.dumps(row) + "\n" for row in rows)
+    return _csv_text([
+        [json.dumps(row["inputs"]) if column == "inputs" else row[column] for column in EXPORT_CSV_COLUMNS]
+        for row in rows
+    ])
+
+async def export_calculations(query: dict, format: str) -> AsyncIterator[str]:
+    """Yield the export one cursor batch at a time, so memory stays flat however long the history is."""
+    if format == "csv":
+        yield _csv_text([EXPORT_CSV_COLUMNS])
+    cursor = db.calculations.find(query, EXPORT_PROJECTION).sort(
+        [("timestamp", 1), ("_id", 1)]
+    ).batch_size(EXPORT_BATCH_SIZE)
+    rows = []
+    try:
+        async for doc in cursor:
+            rows.append(export_row(doc))
+            if len(rows) >= EXPORT_BATCH_SIZE:
+                yield format_export_rows(rows, format)
+                rows = []
+        if rows:
+            yield format_export_rows(rows, format)
+    finally:
+        # Release the server-side cursor if the client goes away mid-download
+        await cursor.close()
+
+@api_router.get("/calculations/export")
+async def export_calculation_history(
+    format: Literal["csv", "ndjson"] = "csv",
+    after: Optional[str] = None,
+    after_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    current_user: Optional[AuthPrincipal] = Depends(get_current_user)
+):
+    """Stream the caller's full history; resume with the last row's timestamp (and id) as after/after_id.
+
+    Admins may export another user's history with user_id.
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if user_id and user_id != current_user.id and current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    query = {"user_id": user_id or current_user.id}
+    if after and after_id:
+        try:
+            last_id = ObjectId(after_id)
+        except InvalidId:
+            raise HTTPException(status_code=400, detail="Invalid after_id")
+        query["$or"] = [{"timestamp": {"$gt": after}}, {"timestamp": after, "_id": {"$gt": last_id}}]
+    elif after:
+        query["timestamp"] = {"$gt": after}
+
+    filename = f"value-number-history.{format}"
+    return StreamingResponse(
+        export_calculations(query, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def _batch_row_inputs(payload: BatchCalculationInput, i: int) -> dict:
+    # Rebuild the per-calculation input shape the insight prompts expect
+    inputs = {
+        "old_time": {"hours": int(payload.old_time_minutes[i] // 60), "minutes": int(payload.old_time_minutes[i] % 60)},
+        "old_effort": payload.old_effort[i],
+        "training_time": {"hours": int(payload.training_time_minutes[i] // 60), "minutes": int(payload.training_time_minutes[i] % 60)},
+        "new_effort": payload.new_effort[i],
+    }
+    if payload.calculation_type == "w_formula":
+        inputs["old_cost"] = payload.old_cost[i]
+        inputs["new_cost"] = payload.new_cost[i]
+    return inputs
+
+@api_router.post("/calculate/batch", response_model=BatchCalculationResult, response_model_exclude_none=True)
+async def calculate_batch(payload: BatchCalculationInput):
+    # Numeric results only, unless insights are requested for a small batch; rows are not persisted
+    values = evaluate_batch(payload)
+    if payload.include_insights and len(values) > BATCH_MAX_INSIGHT_ROWS:
+        raise HTTPException(status_code=400, detail=f"Insights are limited to batches of {BATCH_MAX_INSIGHT_ROWS} rows")
+    bands = recommendation_band_index(values)
+    counts = np.bincount(bands, minlength=len(RECOMMENDATION_LABELS))
+    batch = BatchCalculationResult(
+        calculation_type=payload.calculation_type,
+        count=len(values),
+        value_number=np.round(values, 2).tolist(),
+        recommendation=RECOMMENDATION_LABELS[bands].tolist(),
+        band_counts=dict(zip(RECOMMENDATION_LABELS.tolist(), counts.tolist()))
+    )
+    if payload.include_insights:
+        results = [
+            ValueNumberResult(value_number=value, calculation_type=payload.calculation_type, recommendation=recommendation, explanation="")
+            for value, recommendation in zip(batch.value_number, batch.recommendation)
+        ]
+        batch.insights = await asyncio.gather(*[
+            generate_ai_insights(result, _batch_row_inputs(payload, i), batched=True) for i, result in enumerate(results)
+        ])
+    return batch
+
+@api_router.post("/calculate/sweep", response_model=SweepResult)
+async def calculate_sweep(request: SweepRequest):
+    # Whole grid in one NumPy pass; no per-cell AI insights
+    return evaluate_sweep(request)
+
+@api_router.post("/calculate/monte-carlo", response_model=MonteCarloResult)
+async def calculate_monte_carlo(request: MonteCarloRequest):
+    # CPU-bound sampling runs off the event loop
+    return await run_in_threadpool(simulate_value_number, request)
+
+@api_router.get("/metrics")
+async def get_metrics(admin: AuthPrincipal = Depends(require_admin)):
+    return {
+        "password_hashing": password_limiter.snapshot(),
+        "password_cost": password_cost.snapshot(),
+        "auth_rate_limits": {limiter.name: limiter.snapshot() for limiter in (auth_ip_limiter, auth_email_limiter)},
+        "user_cache": user_cache.snapshot(),
+        "calculation_writes": calculation_writer.snapshot(),
+        "token_revocations": token_revocations.snapshot(),
+        "insight_cache": insight_cache.snapshot(),
+        "insight_semantic_cache": semantic_insight_cache.snapshot(),
+        "insight_single_flight": insight_flight.snapshot(),
+        "insight_llm_queue": insight_limiter.snapshot(),
+        "insight_llm_breaker": {route.name: route.breaker.snapshot() for route in insight_router.routes},
+        "insight_batcher": insight_batcher.snapshot(),
+        "insight_client": insight_client.snapshot(),
+        "insight_router": insight_router.snapshot(),
+        "insight_backend": insight_backend.snapshot(),
+    }
+
+# Mongo indexes: declared once, ensured at startup, and checked against the queries the app runs
+INDEX_PROGRESS_LOG_SECONDS = float(os.environ.get('INDEX_PROGRESS_LOG_SECONDS', '10'))
+
+MONGO_INDEXES = [
+    {"collection": "users", "keys": [("email", 1)], "unique": True},
+    {"collection": "users", "keys": [("id", 1)]},
+    # _id breaks timestamp ties for keyset pagination of the history
+    {"collection": "calculations", "keys": [("user_id", 1), ("timestamp", -1), ("_id", -1)]},
+    # Only deferred-insight records carry a job id
+    {"collection": "calculations", "keys": [("insight_job_id", 1)], "sparse": True},
+    {"collection": "calculation_rollups", "keys": [("scope", 1), ("day", 1)], "unique": True},
+    {"collection": "concepts_access", "keys": [("timestamp", -1)]},
+    # Expire persisted insights so the Mongo cache tier stays bounded
+    {"collection": "insight_cache", "keys": [("created_at", 1)], "expireAfterSeconds": INSIGHT_CACHE_MONGO_TTL_SECONDS},
+    # Revocations only need to outlive the tokens they revoke
+    {"collection": "revoked_tokens", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    {"collection": "revoked_tokens", "keys": [("key", 1)], "unique": True},
+    {"collection": "refresh_tokens", "keys": [("token_hash", 1)], "unique": True},
+    {"collection": "refresh_tokens", "keys": [("family_id", 1)]},
+    {"collection": "refresh_tokens", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+]
+
+# Representative shapes of the app's queries, explained to catch any that would scan a whole collection
+INDEX_PROBE_QUERIES = [
+    {"name": "login: user by email", "collection": "users", "filter": {"email": "probe@example.com"}},
+    {"name": "auth: user by id", "collection": "users", "filter": {"id": "probe"}},
+    {"name": "history: calculations by user", "collection": "calculations", "filter": {"user_id": "probe"}, "sort": [("timestamp", -1), ("_id", -1)]},
+    {"name": "insight job: calculation by job id", "collection": "calculations", "filter": {"insight_job_id": "probe"}},
+    {"name": "rollups: buckets by scope", "collection": "calculation_rollups", "filter": {"scope": "probe", "day": {"$gte": "2000-01-01"}}, "sort": [("day", 1)]},
+    {"name": "concepts access: latest", "collection": "concepts_access", "filter": {}, "sort": [("timestamp", -1)]},
+    {"name": "revocation: token by key", "collection": "revoked_tokens", "filter": {"key": {"$in": ["probe"]}}},
+    {"name": "refresh: token by hash", "collection": "refresh_tokens", "filter": {"token_hash": "probe", "used": False}},
+    {"name": "refresh: token family", "collection": "refresh_tokens", "filter": {"family_id": "probe"}},
+]
+
+index_report: List[dict] = []
+
+def _index_name(spec: dict) -> str:
+    return "_".join(f"{field}_{direction}" for field, direction in spec["keys"])
+
+async def _log_index_build_progress(collection: str, name: str):
+    while True:
+        await asyncio.sleep(INDEX_PROGRESS_LOG_SECONDS)
+        try:
+            ops = await client.admin.command({"currentOp": 1, "command.createIndexes": collection})
+        except Exception:
+            # Not permitted on every deployment; the start/finish log lines still apply
+            return
+        for op in ops.get("inprog", []):
+            progress = op.get("progress") or {}
+            logging.info(f"Index {collection}.{name} building: {progress.get('done', '?')}/{progress.get('total', '?')} {op.get('msg', '')}".rstrip())
+
+async def ensure_indexes():
+    """Create every declared index, logging build progress; failures are logged and reported, not raised."""
+    index_report[:] = [
+        {"collection": spec["collection"], "name": _index_name(spec), "status": "pending"} for spec in MONGO_INDEXES
+    ]
+    for i, (spec, entry) in enumerate(zip(MONGO_INDEXES, index_report), start=1):
+        options = {key: value for key, value in spec.items() if key not in ("collection", "keys")}
+        logging.info(f"Ensuring index {i}/{len(MONGO_INDEXES)}: {entry['collection']}.{entry['name']}")
+        entry["status"] = "building"
+        start = time.perf_counter()
+        progress = asyncio.create_task(_log_index_build_progress(entry["collection"], entry["name"]))
+        try:
+            await db[spec["collection"]].create_index(spec["keys"], name=entry["name"], **options)
+            entry["status"] = "ready"
+        except Exception as e:
+            entry["status"] = "failed"
+            entry["error"] = str(e)
+            logging.warning(f"Failed to ensure index {entry['collection']}.{entry['name']}: {str(e)}")
+        finally:
+            progress.cancel()
+        entry["seconds"] = round(time.perf_counter() - start, 3)
+    ready = sum(entry["status"] == "ready" for entry in index_report)
+    logging.info(f"Mongo indexes ready: {ready}/{len(index_report)}")
+
+def _plan_stages(plan: dict) -> List[str]:
+    stages = [plan.get("stage", "")]
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            stages.extend(_plan_stages(child))
+    return stages
+
+async def explain_probe_queries() -> List[dict]:
+    results = []
+    for probe in INDEX_PROBE_QUERIES:
+        cursor = db[probe["collection"]].find(probe["filter"]).limit(1)
+        if probe.get("sort"):
+            cursor = cursor.sort(probe["sort"])
+        entry = {"name": probe["name"], "collection": probe["collection"]}
+        try:
+            explained = await cursor.explain()
+            stages = _plan_stages(explained["queryPlanner"]["winningPlan"])
+            entry["plan"] = stages
+            entry["collection_scan"] = "COLLSCAN" in stages
+        except Exception as e:
+            entry["error"] = str(e)
+        results.append(entry)
+    return results
+
+async def profiled_collection_scans(limit: int = 20) -> List[dict]:
+    """Recent collection scans recorded by the database profiler, when profiling is enabled."""
+    try:
+        return await db.system.profile.find(
+            {"planSummary": "COLLSCAN"},
+            {"_id": 0, "ns": 1, "op": 1, "command": 1, "millis": 1, "docsExamined": 1, "ts": 1}
+        ).sort("ts", -1).to_list(limit)
+    except Exception:
+        return []
+
+@api_router.get("/admin/indexes")
+async def get_index_report(admin: AuthPrincipal = Depends(require_admin)):
+    queries = await explain_probe_queries()
+    return {
+        "indexes": index_report,
+        "queries": queries,
+        "collection_scans": [query["name"] for query in queries if query.get("collection_scan")],
+        "profiled_collection_scans": await profiled_collection_scans(),
+    }
 
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
@@ -624,6 +3035,36 @@ async def export_drive_build(background_tasks: BackgroundTasks):
 app.include_router(api_router)
 
 
+@app.on_event("startup")
+async def startup_insight_client():
+    logging.info(f"AI insight backend: {insight_backend.name}")
+
+
+@app.on_event("startup")
+async def startup_password_cost():
+    if BCRYPT_ROUNDS is None:
+        await asyncio.get_running_loop().run_in_executor(password_executor, password_cost.calibrate)
+    logging.info(f"bcrypt cost: {password_cost.rounds} rounds")
+
+
+@app.on_event("startup")
+async def startup_indexes():
+    # Builds on large collections can take a while; serve requests meanwhile
+    _spawn(ensure_indexes())
+
+
+@app.on_event("startup")
+async def startup_token_revocations():
+    _spawn(refresh_token_revocations())
+
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    # Drain buffered writes while the connection is still open
+    await calculation_writer.close()
+    client.close()
+
+
+@app.on_event("shutdown")
+async def shutdown_password_executor():
+    password_executor.shutdown(wait=False)
\ No newline at end of file
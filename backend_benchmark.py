@@ -0,0 +1,179 @@
+"""Value Number™ backend micro-benchmarks.
+
+Run from the repository root with the backend dependencies installed:
+
+    python backend_benchmark.py calculate-replay
+    python backend_benchmark.py auth-principal
+    BENCHMARK_BASE_URL=http://localhost:8001 python backend_benchmark.py login-storm
+
+Insight calls are served by the offline replay backend, so no network or LLM key is needed.
+Record real responses first with INSIGHT_BACKEND=record on a running server to replay them here.
+The login-storm benchmark needs a running server (and its MongoDB) at BENCHMARK_BASE_URL; start that
+server with AUTH_RATE_EMAIL_BURST and AUTH_RATE_IP_BURST raised above the login count, or most logins get 429.
+Set BENCHMARK_ADMIN_TOKEN to an admin's access token to also print the admin-only /api/metrics pool stats.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import timeit
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+import numpy as np
+import requests
+
+# Importing the server only needs its environment; Motor does not connect until the first query
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'valuenumber_benchmark')
+os.environ.setdefault('EMERGENT_LLM_KEY', 'benchmark-key')
+os.environ.setdefault('INSIGHT_BACKEND', 'replay')
+os.environ.setdefault('INSIGHT_CACHE_PERSISTENT', 'false')
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+import server  # noqa: E402
+
+
+def report(name, seconds, number):
+    print(f"   {name:<40} {seconds / number * 1e6:10.2f} µs/call")
+
+
+def benchmark_calculate_replay(requests_total=400, concurrency=50, distinct=40):
+    """End-to-end S-formula calculate path against replayed LLM latency: caching, coalescing and limits."""
+    print(f"\n🔍 Calculate path with replayed insights ({requests_total} requests, {concurrency} concurrent, {distinct} distinct scenarios)...")
+
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            async def one(i):
+                payload = {
+                    "old_time": {"hours": 1 + i % distinct, "minutes": 0},
+                    "old_effort": 7.0,
+                    "training_time": {"hours": 1, "minutes": 0},
+                    "new_effort": 4.0
+                }
+                async with semaphore:
+                    start = timeit.default_timer()
+                    response = await client.post("/api/calculate/s-formula", json=payload)
+                    latencies.append(timeit.default_timer() - start)
+                    response.raise_for_status()
+
+            start = timeit.default_timer()
+            await asyncio.gather(*[one(i) for i in range(requests_total)])
+            elapsed = timeit.default_timer() - start
+            # /api/metrics is admin-only; read the same snapshot in process
+            metrics = await server.get_metrics(admin=None)
+        return elapsed, np.array(latencies) * 1000, metrics
+
+    elapsed, latencies_ms, metrics = asyncio.run(run())
+    print(f"   Throughput: {requests_total / elapsed:.1f} req/s")
+    print(f"   Latency p50 {np.percentile(latencies_ms, 50):.1f} ms, p95 {np.percentile(latencies_ms, 95):.1f} ms, max {latencies_ms.max():.1f} ms")
+    print(f"   LLM calls: {metrics['insight_backend'].get('calls')}, deduplicated: {metrics['insight_single_flight']['deduplicated']}, "
+          f"cache hit ratio: {metrics['insight_cache']['hit_ratio']}, router: {metrics['insight_router']['decisions']}")
+
+
+def benchmark_login_storm(logins=200, login_concurrency=32, probe_interval=0.05):
+    """Latency of an unrelated endpoint (GET /api/) while a burst of logins runs bcrypt verifies."""
+    base_url = os.environ.get('BENCHMARK_BASE_URL', 'http://localhost:8001')
+    print(f"\n🔍 Login storm against {base_url} ({logins} logins, {login_concurrency} concurrent)...")
+
+    credentials = {"email": f"bench{uuid.uuid4().hex[:12]}@example.com", "password": "benchmark-pass-123"}
+    requests.post(f"{base_url}/api/register", json=credentials, timeout=30).raise_for_status()
+
+    def probe_latencies(stop):
+        latencies = []
+        while not stop.is_set():
+            start = timeit.default_timer()
+            requests.get(f"{base_url}/api/", timeout=30)
+            latencies.append((timeit.default_timer() - start) * 1000)
+            stop.wait(probe_interval)
+        return np.array(latencies)
+
+    def probe_for(seconds):
+        done = threading.Event()
+        threading.Timer(seconds, done.set).start()
+        return probe_latencies(done)
+
+    idle = probe_for(2.0)
+
+    event = threading.Event()
+    with ThreadPoolExecutor(max_workers=login_concurrency + 1) as pool:
+        probe = pool.submit(probe_latencies, event)
+        start = timeit.default_timer()
+        statuses = list(pool.map(lambda _: requests.post(f"{base_url}/api/login", json=credentials, timeout=60).status_code, range(logins)))
+        storm_seconds = timeit.default_timer() - start
+        event.set()
+        storm = probe.result()
+
+    print(f"   Logins: {logins / storm_seconds:.1f}/s, statuses {dict(Counter(statuses))}")
+    for label, latencies in (("idle", idle), ("during storm", storm)):
+        print(f"   GET /api/ {label:<13} p50 {np.percentile(latencies, 50):7.1f} ms, p95 {np.percentile(latencies, 95):7.1f} ms, max {latencies.max():7.1f} ms")
+    admin_token = os.environ.get('BENCHMARK_ADMIN_TOKEN')
+    if admin_token:
+        metrics = requests.get(f"{base_url}/api/metrics", headers={"Authorization": f"Bearer {admin_token}"}, timeout=30).json()
+        print(f"   Password hashing pool: {metrics.get('password_hashing')}")
+
+
+def benchmark_auth_principal(number=20000):
+    """Per-request validation and serialization: full User document vs. the projected AuthPrincipal."""
+    print(f"\n🔍 Auth principal construction ({number} calls)...")
+
+    user = server.User(email="bench@example.com", password_hash=server.hash_password("benchmark-pass-123"))
+    document = user.dict()
+    projected = {field: document[field] for field in server.AUTH_PRINCIPAL_PROJECTION if field in document}
+    claims = {"sub": user.id, "email": user.email, "created_at": user.created_at, "is_active": user.is_active}
+
+    def full_user():
+        # What get_current_user built from the whole users document before the projection
+        return server.User(**document).dict()
+
+    def projected_principal():
+        return server.AuthPrincipal(**projected).dict()
+
+    def stateless_principal():
+        return server.AuthPrincipal.model_construct(
+            id=claims["sub"], email=claims["email"], created_at=claims["created_at"], is_active=claims["is_active"]
+        ).dict()
+
+    baseline = timeit.timeit(full_user, number=number)
+    report("User (EmailStr, password hash)", baseline, number)
+    for name, fn in (("projected AuthPrincipal", projected_principal), ("AuthPrincipal from token claims", stateless_principal)):
+        seconds = timeit.timeit(fn, number=number)
+        report(name, seconds, number)
+        print(f"   Saved per request: {(baseline - seconds) / number * 1e6:.2f} µs")
+    print(f"   Document bytes: full {len(repr(document))}, projected {len(repr(projected))}")
+
+
+BENCHMARKS = {
+    "calculate-replay": benchmark_calculate_replay,
+    "login-storm": benchmark_login_storm,
+    "auth-principal": benchmark_auth_principal,
+}
+# Benchmarks that need a running server are only run when named explicitly
+LIVE_BENCHMARKS = {"login-storm"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Value Number™ backend benchmarks")
+    parser.add_argument("benchmarks", nargs="*", help=f"benchmarks to run: {', '.join(sorted(BENCHMARKS))} (default: all offline ones)")
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    print("🚀 Starting Value Number™ Backend Benchmarks")
+    print("=" * 50)
+    for name in args.benchmarks or sorted(set(BENCHMARKS) - LIVE_BENCHMARKS):
+        BENCHMARKS[name]()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 import requests
 import sys
+import time
 from datetime import datetime
 import json
 
@@ -501,6 +502,368 @@ class SimpleAPITester:
             })
             return False
 
+    def test_batch_calculation(self):
+        """Test Value Number™ vectorized batch calculation endpoint"""
+        test_data = {
+            "calculation_type": "s_formula",
+            "old_time_minutes": [150, 60, 10],
+            "old_effort": [7.0, 7.0, 7.0],
+            "training_time_minutes": [60, 60, 60],
+            "new_effort": [4.0, 4.0, 4.0]
+        }
+        success, response = self.run_test(
+            "Value Number™ Batch Calculation",
+            "POST",
+            "api/calculate/batch",
+            200,
+            data=test_data
+        )
+
+        if success and response.get('recommendation') != ['strong_go', 'caution', 'no_go']:
+            print(f"❌ Unexpected recommendations: {response.get('recommendation')}")
+            self.failed_tests.append({
+                'name': 'Batch Calculation - Recommendations',
+                'error': f'Unexpected recommendations: {response.get("recommendation")}'
+            })
+            return False
+
+        return success
+
+    def test_sweep_calculation(self):
+        """Test Value Number™ parameter sweep endpoint"""
+        test_data = {
+            "calculation_type": "s_formula",
+            "inputs": {
+                "old_time": {"hours": 2, "minutes": 30},
+                "old_effort": 7.0,
+                "training_time": {"hours": 1, "minutes": 0},
+                "new_effort": 4.0
+            },
+            "x": {"variable": "training_time", "start": 0, "stop": 300, "steps": 7},
+            "y": {"variable": "new_effort", "start": 1, "stop": 10, "steps": 4}
+        }
+        success, response = self.run_test(
+            "Value Number™ Parameter Sweep",
+            "POST",
+            "api/calculate/sweep",
+            200,
+            data=test_data
+        )
+
+        if success:
+            values = response.get('values', [])
+            if len(values) != 4 or any(len(row) != 7 for row in values):
+                print(f"❌ Expected a 4x7 value matrix")
+                self.failed_tests.append({
+                    'name': 'Parameter Sweep - Matrix Shape',
+                    'error': 'Expected a 4x7 value matrix'
+                })
+                return False
+
+        return success
+
+    def test_monte_carlo_calculation(self):
+        """Test Value Number™ Monte Carlo uncertainty endpoint"""
+        test_data = {
+            "calculation_type": "s_formula",
+            "old_time": {"kind": "triangular", "low": 120, "mode": 150, "high": 210},
+            "training_time": {"kind": "normal", "mean": 60, "std": 10},
+            "new_effort": {"kind": "uniform", "low": 3, "high": 5},
+            "samples": 100000,
+            "seed": 42
+        }
+        success, response = self.run_test(
+            "Value Number™ Monte Carlo Simulation",
+            "POST",
+            "api/calculate/monte-carlo",
+            200,
+            data=test_data
+        )
+
+        if success:
+            total = sum(response.get('probabilities', {}).values())
+            if abs(total - 1.0) > 1e-3:
+                print(f"❌ Band probabilities sum to {total}, expected 1.0")
+                self.failed_tests.append({
+                    'name': 'Monte Carlo Simulation - Probabilities',
+                    'error': f'Band probabilities sum to {total}'
+                })
+                return False
+
+        return success
+
+    def test_async_insight_calculation(self):
+        """Test Value Number™ S-formula calculation with deferred AI insights"""
+        test_data = {
+            "old_time": {"hours": 2, "minutes": 30},
+            "old_effort": 7.0,
+            "training_time": {"hours": 1, "minutes": 0},
+            "new_effort": 4.0
+        }
+        url = f"{self.base_url}/api/calculate/s-formula"
+        self.tests_run += 1
+        print(f"\n🔍 Testing Value Number™ S-Formula (Async Insights)...")
+        print(f"   URL: {url}?async_insights=true")
+
+        try:
+            response = requests.post(url, params={"async_insights": "true"}, json=test_data, timeout=30)
+            response.raise_for_status()
+            job_id = response.json().get('insight_job_id')
+            print(f"   Insight job: {job_id}")
+
+            # Poll until the insight job finishes
+            job = {}
+            if job_id:
+                for _ in range(30):
+                    poll = requests.get(f"{self.base_url}/api/insights/{job_id}", timeout=30)
+                    poll.raise_for_status()
+                    job = poll.json()
+                    if job.get('status') != 'pending':
+                        break
+                    time.sleep(1)
+            print(f"   Job status: {job.get('status')}")
+
+            success = job.get('status') == 'ready'
+            if success:
+                self.tests_passed += 1
+                print(f"✅ Passed - deferred insight ready")
+            else:
+                print(f"❌ Failed - job {job_id} status {job.get('status')}")
+                self.failed_tests.append({
+                    'name': 'Value Number™ S-Formula (Async Insights)',
+                    'error': f'Insight job {job_id} ended as {job.get("status")}'
+                })
+            return success
+
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            self.failed_tests.append({
+                'name': 'Value Number™ S-Formula (Async Insights)',
+                'error': str(e)
+            })
+            return False
+
+    def test_streaming_calculation(self):
+        """Test Value Number™ S-formula Server-Sent Events stream"""
+        test_data = {
+            "old_time": {"hours": 2, "minutes": 30},
+            "old_effort": 7.0,
+            "training_time": {"hours": 1, "minutes": 0},
+            "new_effort": 4.0
+        }
+        url = f"{self.base_url}/api/calculate/s-formula/stream"
+        self.tests_run += 1
+        print(f"\n🔍 Testing Value Number™ S-Formula Stream...")
+        print(f"   URL: {url}")
+
+        try:
+            response = requests.post(url, json=test_data, timeout=30, stream=True)
+            events = [line[len('event: '):] for line in response.iter_lines(decode_unicode=True) if line and line.startswith('event: ')]
+            print(f"   Events: {events}")
+
+            success = response.status_code == 200 and events[:1] == ['result'] and events[-1:] == ['done']
+            if success:
+                self.tests_passed += 1
+                print(f"✅ Passed - result event first, done event last")
+            else:
+                print(f"❌ Failed - Status {response.status_code}, events {events}")
+                self.failed_tests.append({
+                    'name': 'S-Formula Stream',
+                    'error': f'Status {response.status_code}, events {events}'
+                })
+            return success
+
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            self.failed_tests.append({
+                'name': 'S-Formula Stream',
+                'error': str(e)
+            })
+            return False
+
+    def test_calculation_history(self, access_token):
+        """Test keyset-paginated calculation history for the authenticated user"""
+        headers = {'Authorization': f'Bearer {access_token}'}
+        self.tests_run += 1
+        print(f"\n🔍 Testing Calculation History...")
+
+        try:
+            response = requests.get(f"{self.base_url}/api/calculations/history", params={"limit": 1}, headers=headers, timeout=30)
+            page = response.json() if response.status_code == 200 else None
+            cursor = response.headers.get('X-Next-Cursor')
+            print(f"   Status: {response.status_code}, rows: {len(page) if page is not None else None}, next cursor: {bool(cursor)}")
+
+            success = isinstance(page, list) and len(page) <= 1
+            if success and cursor:
+                next_page = requests.get(f"{self.base_url}/api/calculations/history", params={"limit": 1, "cursor": cursor}, headers=headers, timeout=30)
+                success = next_page.status_code == 200 and all(row['id'] != page[0]['id'] for row in next_page.json())
+            if success:
+                self.tests_passed += 1
+                print(f"✅ Passed - history page returned")
+            else:
+                print(f"❌ Failed - Response: {response.text[:200]}...")
+                self.failed_tests.append({
+                    'name': 'Calculation History',
+                    'error': f'Status {response.status_code}'
+                })
+            return success
+
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            self.failed_tests.append({
+                'name': 'Calculation History',
+                'error': str(e)
+            })
+            return False
+
+    def test_calculation_export(self, access_token):
+        """Test streaming NDJSON export of the authenticated user's calculation history"""
+        headers = {'Authorization': f'Bearer {access_token}'}
+        self.tests_run += 1
+        print(f"\n🔍 Testing Calculation Export...")
+
+        try:
+            response = requests.get(f"{self.base_url}/api/calculations/export", params={"format": "ndjson"}, headers=headers, timeout=60, stream=True)
+            rows = [json.loads(line) for line in response.iter_lines(decode_unicode=True) if line]
+            print(f"   Status: {response.status_code}, rows: {len(rows)}")
+
+            success = response.status_code == 200 and all('id' in row and 'timestamp' in row for row in rows)
+            if success:
+                self.tests_passed += 1
+                print(f"✅ Passed - export streamed")
+            else:
+                print(f"❌ Failed - Status {response.status_code}")
+                self.failed_tests.append({
+                    'name': 'Calculation Export',
+                    'error': f'Status {response.status_code}'
+                })
+            return success
+
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            self.failed_tests.append({
+                'name': 'Calculation Export',
+                'error': str(e)
+            })
+            return False
+
+    def test_calculation_rollups(self, access_token):
+        """Test that the per-user all-time rollup count grows after an authenticated calculation"""
+        headers = {'Authorization': f'Bearer {access_token}'}
+        url = f"{self.base_url}/api/calculations/rollups"
+        test_data = {
+            "old_time": {"hours": 2, "minutes": 30},
+            "old_effort": 7.0,
+            "training_time": {"hours": 1, "minutes": 0},
+            "new_effort": 4.0
+        }
+        self.tests_run += 1
+        print(f"\n🔍 Testing Calculation Rollups...")
+
+        def all_time_count():
+            response = requests.get(url, headers=headers, timeout=30)
+            response.raise_for_status()
+            return (response.json().get('all_time') or {}).get('count', 0)
+
+        try:
+            before = all_time_count()
+            response = requests.post(f"{self.base_url}/api/calculate/s-formula", json=test_data, headers=headers, timeout=10)
+            response.raise_for_status()
+
+            # Calculations reach the rollups through the write-behind buffer, so allow for its flush delay
+            after = before
+            for _ in range(10):
+                time.sleep(1)
+                after = all_time_count()
+                if after > before:
+                    break
+            print(f"   All-time count: {before} -> {after}")
+
+            success = after > before
+            if success:
+                self.tests_passed += 1
+                print(f"✅ Passed - rollup count grew")
+            else:
+                print(f"❌ Failed - all-time count did not grow")
+                self.failed_tests.append({
+                    'name': 'Calculation Rollups',
+                    'error': f'All-time count stayed at {after}'
+                })
+            return success
+
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            self.failed_tests.append({
+                'name': 'Calculation Rollups',
+                'error': str(e)
+            })
+            return False
+
+    def test_token_refresh(self, user_credentials):
+        """Test refresh token rotation and rejection of a reused refresh token"""
+        success, response = self.run_test(
+            "User Login (Refresh Token)",
+            "POST",
+            "api/login",
+            200,
+            data=user_credentials
+        )
+        refresh_token = response.get('refresh_token') if success else None
+        if not refresh_token:
+            return False
+
+        success, rotated = self.run_test(
+            "Token Refresh",
+            "POST",
+            "api/token/refresh",
+            200,
+            data={"refresh_token": refresh_token}
+        )
+        if not success or not rotated.get('refresh_token') or rotated.get('refresh_token') == refresh_token:
+            return False
+
+        # The original refresh token was rotated away and must not work again
+        success, _ = self.run_test(
+            "Token Refresh (Reused Token)",
+            "POST",
+            "api/token/refresh",
+            401,
+            data={"refresh_token": refresh_token}
+        )
+        return success
+
+    def test_logout(self, access_token):
+        """Test that a logged-out access token is rejected"""
+        headers = {'Authorization': f'Bearer {access_token}'}
+        self.tests_run += 1
+        print(f"\n🔍 Testing User Logout...")
+
+        try:
+            before = requests.get(f"{self.base_url}/api/me", headers=headers, timeout=30).status_code
+            logout = requests.post(f"{self.base_url}/api/logout", headers=headers, timeout=30).status_code
+            after = requests.get(f"{self.base_url}/api/me", headers=headers, timeout=30).status_code
+            print(f"   /api/me before: {before}, logout: {logout}, /api/me after: {after}")
+
+            success = (before, logout, after) == (200, 200, 401)
+            if success:
+                self.tests_passed += 1
+                print(f"✅ Passed - token revoked on logout")
+            else:
+                print(f"❌ Failed - Expected 200/200/401")
+                self.failed_tests.append({
+                    'name': 'User Logout',
+                    'error': f'/api/me before {before}, logout {logout}, /api/me after {after}'
+                })
+            return success
+
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            self.failed_tests.append({
+                'name': 'User Logout',
+                'error': str(e)
+            })
+            return False
+
 def main():
     print("🚀 Starting Value Number™ Backend API Tests")
     print("=" * 50)
@@ -560,6 +923,41 @@ def main():
     if access_token:
         tester.test_w_formula_calculation(access_token)  # With auth
 
+    # 5. Test vectorized batch calculation
+    tester.test_batch_calculation()
+
+    # 6. Test parameter sweep grid
+    tester.test_sweep_calculation()
+
+    # 7. Test Monte Carlo uncertainty mode
+    tester.test_monte_carlo_calculation()
+
+    # 8. Test deferred AI insights
+    tester.test_async_insight_calculation()
+
+    # 9. Test streaming AI insights
+    tester.test_streaming_calculation()
+
+    # 10. Test calculation history pagination
+    if access_token:
+        tester.test_calculation_history(access_token)
+
+    # 11. Test streaming history export
+    if access_token:
+        tester.test_calculation_export(access_token)
+
+    # 12. Test calculation rollups
+    if access_token:
+        tester.test_calculation_rollups(access_token)
+
+    # 13. Test refresh token rotation
+    if access_token:
+        tester.test_token_refresh(user_credentials)
+
+    # 14. Test logout revokes the access token
+    if access_token:
+        tester.test_logout(access_token)
+
     # Print results
     print("\n" + "=" * 50)
     print(f"📊 Backend Test Results: {tester.tests_passed}/{tester.tests_run} tests passed")